@@ -1,29 +1,42 @@
 import os
 
+import click
 from dotenv import load_dotenv
 from flask import Flask, jsonify
 from flask_restful import Api
 from flask_jwt_extended import JWTManager
+from flask_migrate import Migrate
 from marshmallow import ValidationError
 from ma import ma
+from db import db, apply_sqlite_pragmas
+from libs.compression import compress_response
+from libs.fast_json import output_json
 from libs.flask_uploads import configure_uploads, patch_request_class
 
 from resources.user import UserRegister, User, UserLogin, TokenRefresh, UserLogout
 from resources.confirmation import Confirmation, ConfirmationByUser
-from resources.item import Item, ItemList
+from resources.item import Item, ItemList, ItemBulk
 from resources.store import Store, StoreList
+from resources.cache import CacheStats
 from blacklist import BLACKLIST
-from resources.image import ImageUpload, Image, AvatarUpload, Avatar
-from libs.image_helper import IMAGE_SET
+from resources.image import ImageUpload, ImageStreamUpload, Image, AvatarUpload, Avatar
+from libs.image_helper import IMAGE_SET, purge_image_parts
+from libs.image_variants import remove_variants
+from libs.outbox import OutboxWorker, start_worker
+from libs.sweeper import purge_confirmations, start_sweeper
 
 
 app = Flask(__name__)
 load_dotenv(".env", verbose=True)
 app.config.from_object("default_config")
 app.config.from_envvar("APPLICATION_SETTINGS")
+apply_sqlite_pragmas(app.config["SQLITE_PRAGMAS"])
 patch_request_class(app, 1 * 1024 * 1024)   # 1MB max size upload
 configure_uploads(app, IMAGE_SET)
 api = Api(app)
+api.representation("application/json")(output_json)
+db.init_app(app)
+migrate = Migrate(app, db)
 
 
 @app.before_first_request
@@ -31,10 +44,25 @@ def create_tables():
     db.create_all()
 
 
+# Unit of work: models only flush in `save_to_db`/`delete_from_db`,
+# every request is committed once here, or rolled back on an error response.
+@app.after_request
+def commit_unit_of_work(response):
+    if response.status_code < 400:
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return response
+
+
+app.after_request(compress_response)
+
 api.add_resource(Item, '/item/<string:name>')
 api.add_resource(ItemList, '/items')
+api.add_resource(ItemBulk, '/items/bulk')
 api.add_resource(Store, '/store/<string:name>')
 api.add_resource(StoreList, '/stores')
+api.add_resource(CacheStats, '/cache/stats')
 api.add_resource(UserRegister, '/register')
 api.add_resource(User, '/user/<int:user_id>')
 api.add_resource(UserLogin, '/login')
@@ -43,6 +71,7 @@ api.add_resource(TokenRefresh, '/refresh')
 api.add_resource(Confirmation, '/user_confirmation/<string:confirmation_id>')
 api.add_resource(ConfirmationByUser, "/confirmation/user/<int:user_id>")
 api.add_resource(ImageUpload, "/upload/image")
+api.add_resource(ImageStreamUpload, "/upload/image/<string:filename>")
 api.add_resource(Image, "/image/<string:filename>")
 api.add_resource(AvatarUpload, "/upload/avatar")
 api.add_resource(Avatar, "/avatar/<int:user_id>")
@@ -124,8 +153,53 @@ def revoked_token_callback():
     })
 
 
+@app.cli.command("purge-confirmations")
+def purge_confirmations_command():
+    """Delete expired confirmations that have been superseded."""
+    stats = purge_confirmations(
+        app.config["CONFIRMATION_SWEEP_BATCH_SIZE"], app.config["CONFIRMATION_SWEEP_PAUSE"]
+    )
+    print(f"Removed {stats['removed']} confirmations in {stats['batches']} batches, {stats['seconds']}s.")
+
+
+@app.cli.command("purge-parts")
+def purge_parts_command():
+    """Delete unfinished uploads older than IMAGE_PART_MAX_AGE."""
+    removed, remaining = purge_image_parts(app.config["IMAGE_PART_MAX_AGE"])
+    print(f"Removed {removed} unfinished uploads, {remaining} still open.")
+
+
+@app.cli.command("outbox-worker")
+@click.option("--once", is_flag=True, help="Send what is due now and exit.")
+def outbox_worker_command(once):
+    """
+    Send queued emails until interrupted. Web servers don't send any, so run
+    this as its own process next to them (or `--once` from cron).
+    """
+    worker = OutboxWorker(app)
+    if once:
+        print(f"Processed {worker.drain()} emails.")
+        return
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+@app.cli.command("shard-images")
+def shard_images_command():
+    """Move uploaded images into the layout set by UPLOADED_IMAGES_SHARD_LEVELS."""
+    moved = 0
+    for old_path, new_path in IMAGE_SET.relayout():
+        remove_variants(old_path)   # cached next to the old path, rendered again on demand
+        moved += 1
+    print(f"Moved {moved} images.")
+
+
 if __name__ == '__main__':
-    from db import db
-    db.init_app(app)
     ma.init_app(app)
+    if app.config["EMAIL_OUTBOX_WORKER"]:
+        start_worker(app)
+    if app.config["CONFIRMATION_SWEEPER"]:
+        start_sweeper(app)
     app.run(port=4000)
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Per-call cost of image filename validation and of finding a user's avatar,
+before (pattern formatted and matched per call, one stat per format) and
+after (libs.image_helper's compiled regex, the `users.avatar` column read
+by `UserModel.find_avatar`).
+
+    python -m benchmarks.image_helper [calls]   # default: 100000
+"""
+
+import os
+import re
+import sys
+import tempfile
+from time import perf_counter
+from typing import Union
+
+from flask import Flask
+
+from db import db
+from libs import image_helper
+from libs.flask_uploads import IMAGES, UploadConfiguration
+from models.user import UserModel
+
+REPEAT = 3
+FILENAMES = ["photo.jpg", "scan (2).png", "a-b_c.d.svg", "../etc/passwd", "no_extension", "x.exe"]
+
+
+def is_filename_safe_before(filename: str) -> bool:
+    allowed_format = "|".join(IMAGES)
+    regex = f"^[a-zA-Z0-9][a-zA-Z0-9_()-\\.]*\\.({allowed_format})$"
+    return re.match(regex, filename) is not None
+
+
+def find_image_any_format_before(filename: str, folder: str) -> Union[str, None]:
+    for _format in IMAGES:
+        image_path = image_helper.IMAGE_SET.path(filename=f"{filename}.{_format}", folder=folder)
+        if os.path.isfile(image_path):
+            return image_path
+    return None
+
+
+def find_avatar_before(user_id: int) -> Union[str, None]:
+    image_path = find_image_any_format_before(f"user_{user_id}", "avatars")
+    return os.path.basename(image_path) if image_path else None
+
+
+def per_call(func, args, calls: int) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = perf_counter()
+        for _ in range(calls):
+            func(*args)
+        timings.append(perf_counter() - start)
+    return min(timings) / calls * 1e6
+
+
+def compare(label: str, before, after, args, calls: int) -> None:
+    assert before(*args) == after(*args)
+    old = per_call(before, args, calls)
+    new = per_call(after, args, calls)
+    print(f"{label:<28} before {old:7.2f}us   after {new:7.2f}us   {old / new:5.1f}x")
+
+
+def main(calls: int) -> None:
+    for filename in FILENAMES:
+        compare(
+            f"validate {filename!r}", is_filename_safe_before, image_helper.is_filename_safe,
+            (filename,), calls,
+        )
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with tempfile.TemporaryDirectory() as destination, app.app_context():
+        image_helper.IMAGE_SET._config = UploadConfiguration(destination)
+        os.makedirs(os.path.join(destination, "avatars"))
+        open(os.path.join(destination, "avatars", "user_1.bmp"), "wb").close()
+        db.create_all()
+        for _id, avatar in ((1, "user_1.bmp"), (2, None)):
+            db.session.add(UserModel(id=_id, username=f"user{_id}", email=f"{_id}@x", password="x", avatar=avatar))
+        db.session.commit()
+        for label, user_id in (("find existing (bmp)", 1), ("find missing", 2)):
+            compare(label, find_avatar_before, UserModel.find_avatar, (user_id,), calls // 10)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 100000)
@@ -0,0 +1,69 @@
+"""
+Compare flask_restful's stdlib JSON output with libs.fast_json (using
+whichever backend is installed) on payloads shaped like the list
+endpoints' responses.
+
+    python -m benchmarks.json_encoding [rows ...]   # default: 10000 100000
+"""
+
+import json
+import sys
+from datetime import datetime
+from time import perf_counter
+
+from libs import fast_json
+
+ITEMS_PER_STORE = 20
+REPEAT = 3
+
+
+def stdlib_output(data) -> bytes:
+    # what flask_restful's output_json hands to the response
+    return (json.dumps(data) + "\n").encode("utf-8")
+
+
+def backends():
+    yield "stdlib (flask_restful)", stdlib_output
+    yield f"fast_json ({fast_json.BACKEND})", lambda data: fast_json.dumps(data) + b"\n"
+
+
+def best_of(encode, data) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = perf_counter()
+        encode(data)
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def payloads(rows: int):
+    items = [
+        {"name": f"item {i}", "price": i / 3, "store_id": i // ITEMS_PER_STORE, "id": i}
+        for i in range(rows)
+    ]
+    stores = [
+        {"name": f"store {s}", "id": s, "items": items[s * ITEMS_PER_STORE:(s + 1) * ITEMS_PER_STORE]}
+        for s in range(rows // ITEMS_PER_STORE)
+    ]
+    confirmations = [
+        {"id": f"{i:032x}", "expire_at": 1600000000 + i, "confirmed": bool(i % 2),
+         "created": datetime(2020, 6, 1, 12, 0, i % 60).isoformat()}
+        for i in range(rows)
+    ]
+    yield f"/items ({rows})", {"items": items, "next_after": None}
+    yield f"/stores ({len(stores)})", {"stores": stores}
+    yield f"/confirmation ({rows})", {"confirmations": confirmations}
+
+
+def main(sizes) -> None:
+    for rows in sizes:
+        for label, data in payloads(rows):
+            baseline = None
+            for name, encode in backends():
+                seconds = best_of(encode, data)
+                baseline = baseline or seconds
+                print(f"{label:<22} {name:<24} {seconds:8.4f}s  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
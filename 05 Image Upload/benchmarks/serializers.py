@@ -0,0 +1,60 @@
+"""
+Compare compiled `many=True` dumps (libs.schema_compiler) with stock
+marshmallow on in-memory items and stores.
+
+    python -m benchmarks.serializers [rows ...]     # default: 10000 100000
+"""
+
+import sys
+from time import perf_counter
+from types import SimpleNamespace
+
+from marshmallow import Schema
+
+from libs.schema_compiler import CompiledDumpMixin
+from models.item import ItemModel
+from schemas.item import ItemSchema
+from schemas.store import StoreSchema
+
+ITEMS_PER_STORE = 20
+REPEAT = 3
+
+
+def best_of(dump, objs) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        start = perf_counter()
+        dump(objs)
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def compare(label: str, schema: Schema, objs) -> None:
+    CompiledDumpMixin.compile_dumps = False
+    stock = best_of(schema.dump, objs)
+    expected = schema.dump(objs)
+    CompiledDumpMixin.compile_dumps = True
+    compiled = best_of(schema.dump, objs)
+    assert schema.dump(objs) == expected
+    print(f"{label:<24} stock {stock:8.3f}s   compiled {compiled:8.3f}s   {stock / compiled:5.1f}x")
+
+
+def main(sizes) -> None:
+    for rows in sizes:
+        items = [
+            ItemModel(id=i, name=f"item {i}", price=i / 100, store_id=i // ITEMS_PER_STORE)
+            for i in range(rows)
+        ]
+        stores = [
+            SimpleNamespace(
+                id=s, name=f"store {s}",
+                item_list=items[s * ITEMS_PER_STORE:(s + 1) * ITEMS_PER_STORE],
+            )
+            for s in range(rows // ITEMS_PER_STORE)
+        ]
+        compare(f"{rows} items", ItemSchema(many=True), items)
+        compare(f"{len(stores)} stores ({rows} items)", StoreSchema(many=True), stores)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,121 @@
+"""
+Concurrent read/write throughput on a SQLite file with SQLAlchemy's default
+engine settings and with the tuning profile from default_config
+(SQLALCHEMY_ENGINE_OPTIONS and SQLITE_PRAGMAS).
+
+    python -m benchmarks.sqlite_concurrency [seconds]   # default: 5
+
+Writers insert and update rows of an items-like table, one short
+transaction each; readers look rows up by name and read pages, like
+Item.get and ItemList.get.
+"""
+
+import os
+import sys
+import tempfile
+from random import randrange
+from threading import Event, Thread
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark")     # read by default_config
+import default_config  # noqa: E402
+from db import apply_sqlite_pragmas  # noqa: E402
+
+WRITERS = 4
+READERS = 4
+ROWS = 10000
+PAGE_SIZE = 50
+
+
+def profiles():
+    yield "default engine", {}, {}
+    yield "tuned (default_config)", default_config.SQLALCHEMY_ENGINE_OPTIONS, default_config.SQLITE_PRAGMAS
+
+
+def make_engine(path: str, options, pragmas):
+    engine = create_engine(f"sqlite:///{path}", **options)
+    apply_sqlite_pragmas(pragmas, engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, name VARCHAR(50) UNIQUE NOT NULL,"
+            " price FLOAT NOT NULL, store_id INTEGER NOT NULL)"
+        ))
+        connection.execute(
+            text("INSERT INTO items (name, price, store_id) VALUES (:name, :price, 1)"),
+            [{"name": f"item {i}", "price": i / 100} for i in range(ROWS)],
+        )
+    return engine
+
+
+def writer(engine, stop: Event, counts: dict, index: int) -> None:
+    n = 0
+    while not stop.is_set():
+        try:
+            with engine.begin() as connection:
+                connection.execute(
+                    text("INSERT INTO items (name, price, store_id) VALUES (:name, 1, 1)"),
+                    {"name": f"new {index}-{n}"},
+                )
+                connection.execute(
+                    text("UPDATE items SET price = price + 1 WHERE id = :id"), {"id": randrange(ROWS)}
+                )
+            counts["writes"] += 1
+        except OperationalError:
+            counts["locked"] += 1
+        n += 1
+
+
+def reader(engine, stop: Event, counts: dict, index: int) -> None:
+    while not stop.is_set():
+        try:
+            with engine.connect() as connection:
+                connection.execute(
+                    text("SELECT * FROM items WHERE name = :name"), {"name": f"item {randrange(ROWS)}"}
+                ).fetchall()
+                connection.execute(
+                    text("SELECT * FROM items WHERE id > :after ORDER BY id LIMIT :limit"),
+                    {"after": randrange(ROWS), "limit": PAGE_SIZE},
+                ).fetchall()
+            counts["reads"] += 1
+        except OperationalError:
+            counts["locked"] += 1
+
+
+def run(label: str, options, pragmas, seconds: float) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        engine = make_engine(os.path.join(folder, "bench.db"), options, pragmas)
+        stop = Event()
+        # one dict per thread, summed at the end
+        thread_counts = [{"writes": 0, "reads": 0, "locked": 0} for _ in range(WRITERS + READERS)]
+        threads = [
+            Thread(target=writer if i < WRITERS else reader, args=(engine, stop, thread_counts[i], i))
+            for i in range(WRITERS + READERS)
+        ]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = perf_counter() - start
+        engine.dispose()
+    counts = {key: sum(c[key] for c in thread_counts) for key in thread_counts[0]}
+    ops = (counts["writes"] + counts["reads"]) / elapsed
+    print(
+        f"{label:<24} {ops:8.0f} ops/s   writes {counts['writes'] / elapsed:7.0f}/s"
+        f"   reads {counts['reads'] / elapsed:7.0f}/s   'database is locked' {counts['locked']}"
+    )
+
+
+def main(seconds: float) -> None:
+    print(f"{WRITERS} writers, {READERS} readers, {seconds:g}s each")
+    for label, options, pragmas in profiles():
+        run(label, options, pragmas, seconds)
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if sys.argv[1:] else 5)
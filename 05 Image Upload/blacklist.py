@@ -1 +1,49 @@
-BLACKLIST= set()
\ No newline at end of file
+"""
+Revoked JWT store shared by all workers.
+Revoked `jti`s are persisted in the `revoked_tokens` table together with
+the token expiry, so they survive restarts and are purged once the token
+could no longer be valid. Revocations are never undone, so a small
+in-process LRU remembers the revoked `jti`s seen; tokens not (yet) revoked
+are looked up in the table every time, so a logout on any worker takes
+effect everywhere right away.
+"""
+from time import time
+
+from libs.cache import LRUCache
+from models.revoked_token import RevokedTokenModel
+
+
+class RevocationStore:
+    def add(self, jti: str, expire_at: int = None) -> None:
+        raise NotImplementedError
+
+    def __contains__(self, jti: str) -> bool:
+        raise NotImplementedError
+
+
+class DatabaseRevocationStore(RevocationStore):
+    CACHE_SIZE = 4096
+    CACHE_TTL = 3600            # seconds, only revoked jtis are cached
+    PURGE_INTERVAL = 3600       # seconds
+
+    def __init__(self):
+        self._cache = LRUCache(maxsize=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        self._last_purge = 0
+
+    def add(self, jti: str, expire_at: int = None) -> None:
+        RevokedTokenModel(jti=jti, expire_at=expire_at).save_to_db()
+        self._cache.set(jti, True)
+        if time() - self._last_purge > self.PURGE_INTERVAL:
+            self._last_purge = time()
+            RevokedTokenModel.purge_expired()
+
+    def __contains__(self, jti: str) -> bool:
+        if self._cache.get(jti):
+            return True
+        revoked = RevokedTokenModel.find_by_jti(jti) is not None
+        if revoked:
+            self._cache.set(jti, True)
+        return revoked
+
+
+BLACKLIST = DatabaseRevocationStore()
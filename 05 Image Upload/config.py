@@ -4,3 +4,7 @@ DEBUG = False
 
 SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///data.db")
 
+# The SQLite tuning from default_config doesn't apply to other databases
+if not SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLITE_PRAGMAS = {}
@@ -1,3 +1,60 @@
+import sqlite3
+from typing import Dict, Union
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from libs.cache import cache
+
+db = SQLAlchemy()
+
+
+def save_changes(commit: bool = False) -> None:
+    """
+    Flush pending changes so they get ids and hit constraints. Requests
+    commit once at the end (see `commit_unit_of_work` in app.py); pass
+    `commit=True` to commit right away when working outside a request.
+    """
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+
+
+def invalidate_on_commit(*keys: str) -> None:
+    """Drop cache `keys` once the current transaction commits."""
+    db.session.info.setdefault("cache_keys", set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_cache(session):
+    cache.invalidate(*session.info.pop("cache_keys", ()))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_cache_keys(session, previous_transaction):
+    # Only when the outermost transaction is rolled back: a SAVEPOINT rolled
+    # back and recovered from (e.g. `CollectionVersionModel.bump`) doesn't
+    # undo what was done before it
+    if previous_transaction.parent is None:
+        session.info.pop("cache_keys", None)
+
+
+def apply_sqlite_pragmas(pragmas: Dict[str, Union[str, int]], target=Engine) -> None:
+    """
+    Run `PRAGMA name=value` for each entry on every new SQLite connection
+    of `target`, by default every engine.
+    """
+    if not pragmas:
+        return
 
-db = SQLAlchemy()
\ No newline at end of file
+    @event.listens_for(target, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
@@ -1,13 +1,81 @@
 import os
 
+from sqlalchemy.pool import QueuePool
+
 DEBUG = True
 
 SQLALCHEMY_DATABASE_URI = 'sqlite:///data.db'
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# SQLite tuning for threaded servers: a real connection pool instead of
+# SQLAlchemy's per-checkout connections for file databases, plus pragmas
+# applied to every new connection (see `db.apply_sqlite_pragmas`).
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "poolclass": QueuePool,
+    "pool_size": 10,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "connect_args": {"check_same_thread": False, "timeout": 30},
+}
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",          # readers don't block the writer
+    "synchronous": "NORMAL",        # safe with WAL, fsync only at checkpoints
+    "busy_timeout": 30000,          # ms to wait for the write lock
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64000,           # negative means KiB, i.e. 64 MB
+}
 PROPAGATE_EXCEPTIONS = True
 APP_SECRET_KEY = os.environ.get("APP_SECRET_KEY")
 JWT_SECRET_KEY = os.environ["JWT_SECRET_KEY"]
 # "UPLOADED_IMAGES must be same as UploadSet in image_helper"
 UPLOADED_IMAGES_DEST = os.path.join("static", "images")
+# Images are per user: browsers keep them but revalidate with the ETag, shared caches don't
+UPLOADED_IMAGES_CACHE_CONTROL = "private, no-cache"
+# "x-sendfile" or "x-accel-redirect" to let the web server send image content;
+# for nginx, map UPLOADED_IMAGES_SENDFILE_URL to UPLOADED_IMAGES_DEST in an internal location
+UPLOADED_IMAGES_SENDFILE = os.environ.get("UPLOADED_IMAGES_SENDFILE")
+UPLOADED_IMAGES_SENDFILE_URL = "/protected/images/"
+# Spread user folders (and the files in SHARDED_FOLDERS) over hash-prefixed
+# directories, e.g. 2 levels: static/images/8f/14/user_7/; 0 keeps the flat layout.
+# Run `flask shard-images` after changing it to move existing files.
+UPLOADED_IMAGES_SHARD_LEVELS = 0
+UPLOADED_IMAGES_SHARDED_FOLDERS = ("avatars",)
+IMAGE_MAX_SIZE = 10 * 1024 * 1024     # bytes, for streamed uploads
+# Unfinished streamed uploads can be resumed for this long, then `flask
+# purge-parts` (run it from cron) removes them
+IMAGE_PART_MAX_AGE = 24 * 3600       # seconds
+IMAGE_MAX_OPEN_PARTS = 5             # unfinished uploads per user
+# Store uploaded images once per content, see `ImageModel`
+IMAGE_DEDUPLICATION = False
+IMAGE_VARIANT_SIZES = (64, 128, 256)  # px, served with ?size=
+IMAGE_VARIANT_WEBP = False            # also keep WebP copies for clients that accept them
+IMAGE_VARIANT_WORKERS = 2             # resizing processes
+IMAGE_VARIANT_TIMEOUT = 10            # seconds to wait for an on-demand resize
 JWT_BLACKLIST_ENABLED = True
 JWT_BLACKLIST_TOKEN_CHECKS = ["access", "refresh"]
+ITEMS_PAGE_SIZE = 50
+ITEMS_MAX_PAGE_SIZE = 500
+ITEMS_STREAM_BATCH_SIZE = 1000
+ITEMS_BULK_CHUNK_SIZE = 500
+# Response compression, see libs.compression. Encodings in order of
+# preference; "br" and "zstd" need the brotli and zstandard packages.
+COMPRESS_ENCODINGS = ("br", "zstd", "gzip")
+COMPRESS_LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+COMPRESS_MIN_SIZE = 1024            # bytes, smaller bodies aren't worth it
+COMPRESS_MIMETYPES = ("application/json", "application/x-ndjson")
+# Send queued emails from a thread when started with `python app.py`; under
+# any other server run `flask outbox-worker` next to the web processes
+EMAIL_OUTBOX_WORKER = True
+EMAIL_OUTBOX_POLL_INTERVAL = 2      # seconds
+EMAIL_OUTBOX_BATCH_SIZE = 20
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF = 10           # seconds, doubled on every failed attempt
+EMAIL_OUTBOX_LEASE = 60             # seconds a worker holds a row while sending
+PASSWORD_SCRYPT_N = 2 ** 14     # CPU/memory cost, raise to make hashing slower
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_HASH_WORKERS = 4
+PASSWORD_HASH_TIMEOUT = 10      # seconds
+CONFIRMATION_SWEEPER = True
+CONFIRMATION_SWEEP_INTERVAL = 3600  # seconds
+CONFIRMATION_SWEEP_BATCH_SIZE = 500
+CONFIRMATION_SWEEP_PAUSE = 0.05     # seconds between batches, lets other writers in
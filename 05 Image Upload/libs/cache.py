@@ -0,0 +1,118 @@
+"""
+libs.cache
+Read-through cache for dumped JSON of read-mostly resources.
+By default, entries live in an in-process LRU with a TTL. Any object
+implementing `CacheBackend` (e.g. a Redis client wrapper) can be plugged
+in with `libs.cache.cache.set_backend(...)`.
+Writes invalidate their keys on commit, but only in their own process's
+LRU: other workers can serve an entry for up to its `ttl` after it
+changed, unless they share a backend.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Optional
+
+
+class CacheBackend:
+    """Storage interface used by `Cache`. Values must be JSON-serializable."""
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe in-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class Cache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = Lock()
+        # raised by every invalidation, so a value loaded before one isn't stored after it
+        self._generation = 0
+        self._write_lock = Lock()
+
+    def set_backend(self, backend: CacheBackend) -> None:
+        self.backend = backend
+
+    def get_or_set(self, key: str, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Return the cached value for `key`, calling `loader` on a miss.
+        A `None` result from `loader` is returned but not cached, and
+        neither is a result loaded while any key was invalidated.
+        """
+        value = self.backend.get(key)
+        with self._stats_lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is not None:
+            return value
+        generation = self._generation
+        value = loader()
+        if value is not None:
+            with self._write_lock:
+                if generation == self._generation:
+                    self.backend.set(key, value)
+        return value
+
+    def invalidate(self, *keys: str) -> None:
+        with self._write_lock:
+            self._generation += 1
+            for key in keys:
+                self.backend.delete(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Hits and misses of this process since it started, see `CacheStats`."""
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+cache = Cache(LRUCache())
@@ -0,0 +1,153 @@
+"""
+libs.compression
+Compresses JSON responses with the best encoding the client accepts:
+brotli or zstd when the `brotli`/`zstandard` packages are installed, gzip
+otherwise. `compress_response` is registered as an `after_request` hook.
+Bodies under `COMPRESS_MIN_SIZE` bytes are sent as they are, streamed
+responses (e.g. `/items?format=ndjson`) are compressed chunk by chunk.
+Compressed bodies are kept in an LRU keyed by encoding, level and a hash of
+the body, so a response rebuilt from the JSON cache is only compressed
+once, and nothing needs invalidating when the JSON changes.
+"""
+
+import zlib
+from hashlib import blake2b
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from flask import current_app, request
+from werkzeug.wrappers import Response
+
+from libs.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# status codes whose body is empty or must be sent as is
+UNCOMPRESSED_STATUSES = {204, 206, 304}
+
+compressed_cache = LRUCache(maxsize=256, ttl=600)
+
+
+class Encoder:
+    """Compresses with one algorithm, either a whole body or a stream of chunks."""
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        raise NotImplementedError
+
+    def stream(self, chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+        raise NotImplementedError
+
+
+class GzipEncoder(Encoder):
+    def _compressobj(self, level: int):
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, level: int) -> bytes:
+        compressor = self._compressobj(level)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+        compressor = self._compressobj(level)
+        for chunk in chunks:
+            # flush every chunk, so the client gets it as soon as it's made
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+class BrotliEncoder(Encoder):
+    def compress(self, data: bytes, level: int) -> bytes:
+        return brotli.compress(data, quality=level)
+
+    def stream(self, chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+
+
+class ZstdEncoder(Encoder):
+    def compress(self, data: bytes, level: int) -> bytes:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    def stream(self, chunks: Iterable[bytes], level: int) -> Iterator[bytes]:
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush()
+
+
+# Content-Encoding -> encoder, for the algorithms available here
+ENCODERS: Dict[str, Encoder] = {"gzip": GzipEncoder()}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder()
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder()
+
+
+def negotiate_encoding() -> Optional[str]:
+    """
+    The `COMPRESS_ENCODINGS` entry the client accepts with the highest
+    quality, earlier entries winning ties. None if it accepts none of them.
+    """
+    available = [encoding for encoding in current_app.config["COMPRESS_ENCODINGS"]
+                 if encoding in ENCODERS]
+    return request.accept_encodings.best_match(available)
+
+
+def _compressed_body(encoder: Encoder, encoding: str, level: int, body: bytes) -> bytes:
+    key = f"{encoding}:{level}:{blake2b(body, digest_size=16).hexdigest()}"
+    compressed = compressed_cache.get(key)
+    if compressed is None:
+        compressed = encoder.compress(body, level)
+        compressed_cache.set(key, compressed)
+    return compressed
+
+
+def _closing(chunks: Iterator[bytes], close: Callable[[], None]) -> Iterator[bytes]:
+    # the response closes our generator, which must close the one it wraps
+    try:
+        yield from chunks
+    finally:
+        close()
+
+
+def compress_response(response: Response) -> Response:
+    """`after_request` hook compressing responses of `COMPRESS_MIMETYPES`."""
+    config = current_app.config
+    if (
+        response.mimetype not in config["COMPRESS_MIMETYPES"]
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    # a 304 must carry the Vary of the response it stands for
+    response.vary.add("Accept-Encoding")
+    if response.status_code in UNCOMPRESSED_STATUSES:
+        return response
+
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    encoder = ENCODERS[encoding]
+    level = config["COMPRESS_LEVELS"][encoding]
+
+    if response.is_streamed:
+        inner = response.response
+        response.response = _closing(
+            encoder.stream(inner, level), getattr(inner, "close", lambda: None)
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < config["COMPRESS_MIN_SIZE"]:
+            return response
+        response.set_data(_compressed_body(encoder, encoding, level, body))
+    response.headers["Content-Encoding"] = encoding
+    return response
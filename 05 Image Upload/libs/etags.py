@@ -0,0 +1,28 @@
+"""
+libs.etags
+Weak ETags made from row and collection versions (see
+`CollectionVersionModel`). Resources look up the version first, a
+primary-key read for a collection or the cached entry for a single row,
+and answer a matching `If-None-Match` with `not_modified` before running
+their query or dumping anything.
+"""
+
+from typing import Dict, Optional
+
+from flask import Response, request
+from werkzeug.http import quote_etag
+
+
+def etag_header(version: int) -> Dict[str, str]:
+    return {"ETag": quote_etag(str(version), weak=True)}
+
+
+def not_modified(version: int) -> Optional[Response]:
+    """
+    A 304 response if the client already has `version`, else None. It is
+    typed as JSON like the response it replaces, so `compress_response`
+    adds the same Vary (Werkzeug drops the Content-Type of a 304 when sending).
+    """
+    if not request.if_none_match.contains_weak(str(version)):
+        return None
+    return Response(status=304, headers=etag_header(version), mimetype="application/json")
@@ -0,0 +1,79 @@
+"""
+libs.fast_json
+JSON encoding for responses. Uses orjson or ujson when one is installed and
+the standard library otherwise; `BACKEND` names the one in use. Every
+backend gives the same output: UTF-8 bytes, floats in their shortest
+round-trip form (so a `price` of 0.1 is `0.1`), dates and datetimes in ISO
+8601, Decimals as floats. `output_json` is the `Api` representation for
+`application/json`, replacing flask_restful's stdlib one.
+"""
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict
+
+from flask import current_app, make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+_indent_encoder = json.JSONEncoder(ensure_ascii=False, indent=2, default=_default)
+
+
+def _stdlib_dumps(data: Any, indent: bool = False) -> bytes:
+    return (_indent_encoder if indent else _encoder).encode(data).encode("utf-8")
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    # datetimes go through `_default` too, so they look the same on every backend
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data: Any, indent: bool = False) -> bytes:
+        options = _OPTIONS | orjson.OPT_INDENT_2 if indent else _OPTIONS
+        try:
+            return orjson.dumps(data, default=_default, option=options)
+        except TypeError:
+            # e.g. integers over 64 bits, which the stdlib can encode
+            return _stdlib_dumps(data, indent)
+
+elif ujson is not None:
+    BACKEND = "ujson"
+
+    def dumps(data: Any, indent: bool = False) -> bytes:
+        try:
+            return ujson.dumps(
+                data, ensure_ascii=False, escape_forward_slashes=False,
+                default=_default, indent=2 if indent else 0,
+            ).encode("utf-8")
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(data, indent)
+
+else:
+    BACKEND = "json"
+    dumps = _stdlib_dumps
+
+
+def output_json(data: Any, code: int, headers: Dict[str, str] = None):
+    """Make a response from resource data, like flask_restful's `output_json`."""
+    response = make_response(dumps(data, indent=current_app.debug) + b"\n", code)
+    response.headers.extend(headers or {})
+    return response
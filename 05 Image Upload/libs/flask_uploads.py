@@ -18,10 +18,14 @@ if PY3:
 else:
     string_types = basestring,
 
+import hashlib
+import mimetypes
 import os.path
 import posixpath
+import re
+from uuid import uuid4
 
-from flask import current_app, send_from_directory, abort, url_for
+from flask import current_app, send_from_directory, abort, url_for, request, send_file
 from itertools import chain
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
@@ -66,6 +70,37 @@ EXECUTABLES = tuple('so exe dll'.split())
 #: The default allowed extensions - `TEXT`, `DOCUMENTS`, `DATA`, and `IMAGES`.
 DEFAULTS = TEXT + DOCUMENTS + IMAGES + DATA
 
+# Conflict resolution strategies
+
+#: Append ``_1``, ``_2``, ... until a free name is found. Costs one stat per
+#: existing candidate.
+CONFLICT_NUMBERED = 'numbered'
+
+#: Append a random UUID. Always a single attempt.
+CONFLICT_UUID = 'uuid'
+
+#: Append a hash of the file's content. Uploading the same content again
+#: reuses the stored file instead of writing a copy.
+CONFLICT_HASH = 'hash'
+
+CONFLICT_STRATEGIES = (CONFLICT_NUMBERED, CONFLICT_UUID, CONFLICT_HASH)
+
+# Ways of handing file transfers to a fronting web server
+
+#: Send an ``X-Sendfile`` header with the file's path (Apache, lighttpd).
+SENDFILE_X_SENDFILE = 'x-sendfile'
+
+#: Send an ``X-Accel-Redirect`` header with the file's URL below the set's
+#: ``SENDFILE_URL``, which nginx maps to an ``internal`` location.
+SENDFILE_X_ACCEL = 'x-accel-redirect'
+
+#: Name of a directory added by sharding, see `UploadConfiguration.shard`.
+SHARD_REGEX = re.compile(r'^[0-9a-f]{2}$')
+
+#: Subfolder of a set's destination holding content-addressed files, see
+#: `UploadSet.save_blob`.
+BLOBS_FOLDER = '.blobs'
+
 
 class UploadNotAllowed(Exception):
     """
@@ -107,6 +142,23 @@ def lowercase_ext(filename):
     return filename
 
 
+def content_hash(storage, buffer_size=16384):
+    """
+    Returns the SHA-256 hex digest of a `werkzeug.FileStorage`'s content and
+    rewinds the stream so it can still be saved.
+
+    :param storage: The uploaded file.
+    :param buffer_size: How many bytes to read at a time.
+    """
+    digest = hashlib.sha256()
+    stream = storage.stream
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(buffer_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
 def addslash(url):
     if url.endswith('/'):
         return url
@@ -171,6 +223,15 @@ def config_for_set(uset, app, defaults=None):
     deny_extns = tuple(config.get(prefix + 'DENY', ()))
     destination = config.get(prefix + 'DEST')
     base_url = config.get(prefix + 'URL')
+    cache_control = config.get(prefix + 'CACHE_CONTROL')
+    shard_levels = config.get(prefix + 'SHARD_LEVELS', 0)
+    sharded_folders = tuple(config.get(prefix + 'SHARDED_FOLDERS', ()))
+    sendfile = config.get(prefix + 'SENDFILE')
+    sendfile_url = config.get(prefix + 'SENDFILE_URL')
+    if sendfile not in (None, SENDFILE_X_SENDFILE, SENDFILE_X_ACCEL):
+        raise RuntimeError("unknown sendfile mode %r for set %s" % (sendfile, uset.name))
+    if sendfile == SENDFILE_X_ACCEL and sendfile_url is None:
+        raise RuntimeError("no sendfile URL for set %s" % uset.name)
 
     if destination is None:
         # the upload set's destination wasn't given
@@ -188,7 +249,9 @@ def config_for_set(uset, app, defaults=None):
     if base_url is None and using_defaults and defaults['url']:
         base_url = addslash(defaults['url']) + uset.name + '/'
 
-    return UploadConfiguration(destination, base_url, allow_extns, deny_extns)
+    return UploadConfiguration(destination, base_url, allow_extns, deny_extns,
+                               cache_control, sendfile, sendfile_url,
+                               shard_levels, sharded_folders)
 
 
 def configure_uploads(app, upload_sets):
@@ -269,16 +332,87 @@ class UploadConfiguration(object):
                   `UploadSet` extensions list.
     :param deny: A list of extensions to deny, even if they are in the
                  `UploadSet` extensions list.
+    :param cache_control: The ``Cache-Control`` header of files sent with
+                          `UploadSet.send_file`. If this is `None`, Flask's
+                          default is used.
+    :param sendfile: `SENDFILE_X_SENDFILE` or `SENDFILE_X_ACCEL` to let the
+                     web server send the files' content, or `None` to send
+                     it from Python.
+    :param sendfile_url: The internal URL (ending with a /) the set's
+                         destination is mapped to, for `SENDFILE_X_ACCEL`.
+    :param shard_levels: How many levels of hash-prefixed directories to
+                         spread files over, see `shard`. 0 keeps the flat
+                         layout.
+    :param sharded_folders: Folders whose files are sharded, instead of the
+                            folder itself.
     """
-    def __init__(self, destination, base_url=None, allow=(), deny=()):
+    def __init__(self, destination, base_url=None, allow=(), deny=(),
+                 cache_control=None, sendfile=None, sendfile_url=None,
+                 shard_levels=0, sharded_folders=()):
         self.destination = destination
         self.base_url = base_url
         self.allow = allow
         self.deny = deny
+        self.cache_control = cache_control
+        self.sendfile = sendfile
+        self.sendfile_url = sendfile_url
+        self.shard_levels = shard_levels
+        self.sharded_folders = sharded_folders
 
     @property
     def tuple(self):
-        return (self.destination, self.base_url, self.allow, self.deny)
+        return (self.destination, self.base_url, self.allow, self.deny,
+                self.cache_control, self.sendfile, self.sendfile_url,
+                self.shard_levels, self.sharded_folders)
+
+    def shard(self, filename):
+        """
+        This returns where a file (its name within the set, including the
+        folder) is kept below the destination. With sharding, the top-level
+        entry is moved into `shard_levels` directories named after the hex
+        digits of its hash, e.g. ``user_7/a.png`` becomes
+        ``8f/14/user_7/a.png``, so the destination doesn't grow into one
+        huge directory. In `sharded_folders`, the files inside are sharded
+        instead: ``avatars/user_7.png`` becomes ``avatars/3c/d0/user_7.png``.
+        Names starting with a dot are internal and never sharded.
+
+        :param filename: The file's name, including the folder.
+        """
+        if not self.shard_levels or filename.startswith('.'):
+            return filename
+        folder, _, rest = filename.partition('/')
+        if rest and folder in self.sharded_folders:
+            return posixpath.join(folder, self._prefix(rest), rest)
+        return posixpath.join(self._prefix(folder), filename)
+
+    def unshard(self, filename):
+        """
+        This is the inverse of `shard`, for a file found below the
+        destination. It recognizes sharded names whatever the number of
+        levels they were saved with, so it can be used to move files
+        between layouts.
+
+        :param filename: The file's path relative to the destination.
+        """
+        parts = filename.split('/')
+        parts = self._strip_prefix(parts)
+        if len(parts) > 2:
+            parts = parts[:1] + self._strip_prefix(parts[1:])
+        return '/'.join(parts)
+
+    def _prefix(self, name, levels=None):
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        levels = self.shard_levels if levels is None else levels
+        return '/'.join(digest[2 * i:2 * i + 2] for i in range(levels))
+
+    def _strip_prefix(self, parts):
+        levels = 0
+        while levels < len(parts) - 1 and SHARD_REGEX.match(parts[levels]):
+            levels += 1
+        # only if the directories really are the hash of the name below them
+        if levels and self._prefix(parts[levels], levels) == '/'.join(parts[:levels]):
+            return parts[levels:]
+        return parts
 
     def __eq__(self, other):
         return self.tuple == other.tuple
@@ -303,14 +437,21 @@ class UploadSet(object):
     :param default_dest: If given, this should be a callable. If you call it
                          with the app, it should return the default upload
                          destination path for that app.
+    :param conflict: How to rename a file whose name is already taken, one of
+                     `CONFLICT_NUMBERED` (the default), `CONFLICT_UUID` or
+                     `CONFLICT_HASH`.
     """
-    def __init__(self, name='files', extensions=DEFAULTS, default_dest=None):
+    def __init__(self, name='files', extensions=DEFAULTS, default_dest=None,
+                 conflict=CONFLICT_NUMBERED):
         if not name.isalnum():
             raise ValueError("Name must be alphanumeric (no underscores)")
+        if conflict not in CONFLICT_STRATEGIES:
+            raise ValueError("Unknown conflict strategy %r" % conflict)
         self.name = name
         self.extensions = extensions
         self._config = None
         self.default_dest = default_dest
+        self.conflict = conflict
 
     @property
     def config(self):
@@ -341,7 +482,7 @@ class UploadSet(object):
             return url_for('_uploads.uploaded_file', setname=self.name,
                            filename=filename, _external=True)
         else:
-            return base + filename
+            return base + self.config.shard(filename)
 
     def path(self, filename, folder=None):
         """
@@ -353,10 +494,8 @@ class UploadSet(object):
                        to save to.
         """
         if folder is not None:
-            target_folder = os.path.join(self.config.destination, folder)
-        else:
-            target_folder = self.config.destination
-        return os.path.join(target_folder, filename)
+            filename = posixpath.join(folder, filename)
+        return os.path.join(self.config.destination, self.config.shard(filename))
 
     def file_allowed(self, storage, basename):
         """
@@ -419,39 +558,249 @@ class UploadSet(object):
             target_folder = os.path.join(self.config.destination, folder)
         else:
             target_folder = self.config.destination
-        if not os.path.exists(target_folder):
-            os.makedirs(target_folder)
-        if os.path.exists(os.path.join(target_folder, basename)):
-            basename = self.resolve_conflict(target_folder, basename)
 
-        target = os.path.join(target_folder, basename)
-        storage.save(target)
+        # Files are created with O_EXCL, so two uploads racing for the same
+        # name can't overwrite each other; the loser resolves the conflict.
+        original = basename
+        resolved = False
+        while True:
+            target_path = self.path(basename, folder)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            try:
+                target = open(target_path, 'xb')
+            except FileExistsError:
+                if resolved and self.conflict == CONFLICT_HASH:
+                    break   # same content is already stored under this name
+                basename = self.resolve_conflict(target_folder, original, storage)
+                resolved = True
+                continue
+            try:
+                with target:
+                    storage.save(target)
+            except BaseException:
+                # e.g. the client disconnected: don't leave a partial file
+                # holding the name
+                os.remove(target_path)
+                raise
+            break
+        if folder:
+            return posixpath.join(folder, basename)
+        else:
+            return basename
+
+    def save_file(self, source, basename, folder=None):
+        """
+        This moves a file that was already written to disk (for example an
+        upload streamed in chunks) into this upload set, without copying it.
+        Conflicts are resolved like in `save`. The source must be on the
+        same filesystem as the set's destination. Returns the file's name
+        including the folder, like `save`.
+
+        :param source: The path of the finished file.
+        :param basename: The name to save the file as.
+        :param folder: The subfolder within the upload set to save to.
+        """
+        basename = self.get_basename(basename)
+        if not self.extension_allowed(extension(basename)):
+            raise UploadNotAllowed()
+
+        if folder:
+            target_folder = os.path.join(self.config.destination, folder)
+        else:
+            target_folder = self.config.destination
+
+        # os.link fails if the name is taken, like the O_EXCL open in `save`
+        original = basename
+        resolved = False
+        while True:
+            target_path = self.path(basename, folder)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            try:
+                os.link(source, target_path)
+                break
+            except FileExistsError:
+                if resolved and self.conflict == CONFLICT_HASH:
+                    break
+                with open(source, 'rb') as stream:
+                    basename = self.resolve_conflict(
+                        target_folder, original, FileStorage(stream, original)
+                    )
+                resolved = True
+        os.remove(source)
         if folder:
             return posixpath.join(folder, basename)
         else:
             return basename
 
-    def resolve_conflict(self, target_folder, basename):
+    def blob_path(self, digest):
+        """
+        This returns the absolute path of the content-addressed file with
+        the given SHA-256 digest. Files are spread over subfolders named
+        after the first two hex digits of their digest.
+
+        :param digest: The file's SHA-256 hex digest.
+        """
+        return self.path(digest, folder=posixpath.join(BLOBS_FOLDER, digest[:2]))
+
+    def save_blob(self, storage):
+        """
+        This saves a `werkzeug.FileStorage` under the hash of its content
+        instead of its name, so identical uploads are stored only once.
+        Mapping names to blobs (and deciding when a blob is no longer used)
+        is up to the caller. The extension is not checked; call
+        `file_allowed` first. Returns the file's SHA-256 digest.
+
+        :param storage: The uploaded file to save.
+        """
+        if not isinstance(storage, FileStorage):
+            raise TypeError("storage must be a werkzeug.FileStorage")
+
+        digest = content_hash(storage)
+        target = self.blob_path(digest)
+        if os.path.exists(target):
+            return digest
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Written under a temporary name and linked into place, so a
+        # concurrent reader never sees a half-written blob
+        temporary = '%s.%s.tmp' % (target, uuid4().hex)
+        with open(temporary, 'xb') as stream:
+            storage.save(stream)
+        self._link_blob(temporary, target)
+        return digest
+
+    def save_file_blob(self, source, digest, keep_source=False):
+        """
+        Like `save_blob`, for a file that was already written to disk. The
+        source file is moved into place, or removed if the blob exists.
+        Returns the digest.
+
+        :param source: The path of the finished file.
+        :param digest: The file's SHA-256 hex digest.
+        :param keep_source: Link the blob to the source file, but don't
+                            remove it.
+        """
+        target = self.blob_path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self._link_blob(source, target, keep_source)
+        return digest
+
+    def _link_blob(self, source, target, keep_source=False):
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            pass    # same content, stored by a concurrent upload
+        if not keep_source:
+            os.remove(source)
+
+    def send_file(self, path, attachment_filename=None, mimetype=None, etag=None):
+        """
+        This sends a file of this set as the response to the current request,
+        with a strong ``ETag`` and ``Last-Modified``, the set's
+        ``Cache-Control`` policy, and ``304 Not Modified`` and byte-range
+        (``206``) responses handled. With a `sendfile` mode configured, only
+        the headers are sent and the web server sends the content (and
+        handles ranges itself). Raises `FileNotFoundError` if the file
+        doesn't exist.
+
+        :param path: The absolute path of the file, as returned by `path`.
+        :param attachment_filename: The name the type is guessed from,
+                                    instead of the file's own name.
+        :param mimetype: The type, instead of guessing it.
+        :param etag: The entity tag, e.g. a hash of the content. Defaults to
+                     one made from the file's modification time and size.
+        """
+        config = self.config
+        stat = os.stat(path)
+        if mimetype is None:
+            mimetype = (mimetypes.guess_type(attachment_filename or path)[0] or
+                        'application/octet-stream')
+        if etag is None:
+            etag = '%x-%x' % (stat.st_mtime_ns, stat.st_size)
+
+        if config.sendfile:
+            response = current_app.response_class(mimetype=mimetype)
+            if config.sendfile == SENDFILE_X_ACCEL:
+                url = os.path.relpath(path, config.destination).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = config.sendfile_url + url
+            else:
+                # Apache and lighttpd need an absolute path, like Flask's `use_x_sendfile`
+                response.headers['X-Sendfile'] = os.path.abspath(path)
+            # the length of the file the server sends, not of this empty body
+            response.content_length = stat.st_size
+        else:
+            response = send_file(path, mimetype=mimetype, add_etags=False)
+            response.headers['Accept-Ranges'] = 'bytes'
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        if config.cache_control is not None:
+            response.headers['Cache-Control'] = config.cache_control
+            response.headers.pop('Expires', None)
+        # Without a length, ranges are left to the web server in sendfile mode
+        response = response.make_conditional(
+            request, accept_ranges=True,
+            complete_length=None if config.sendfile else stat.st_size
+        )
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+        return response
+
+    def resolve_conflict(self, target_folder, basename, storage=None):
         """
         If a file with the selected name already exists in the target folder,
         this method is called to resolve the conflict. It should return a new
         basename for the file.
 
-        The default implementation splits the name and extension and adds a
-        suffix to the name consisting of an underscore and a number, and tries
-        that until it finds one that doesn't exist.
+        Depending on the set's `conflict` strategy, the name gets a suffix
+        consisting of an underscore and either a random UUID, a hash of the
+        file's content, or a number (the first one that doesn't exist).
 
-        :param target_folder: The absolute path to the target.
+        :param target_folder: The absolute path to the target, before
+                              sharding.
         :param basename: The file's original basename.
+        :param storage: The uploaded file, needed for `CONFLICT_HASH`.
         """
         name, ext = os.path.splitext(basename)
+        if self.conflict == CONFLICT_UUID:
+            return '%s_%s%s' % (name, uuid4().hex, ext)
+        if self.conflict == CONFLICT_HASH:
+            return '%s_%s%s' % (name, content_hash(storage)[:32], ext)
+        folder = os.path.relpath(target_folder, self.config.destination)
+        folder = None if folder == '.' else folder.replace(os.sep, '/')
         count = 0
         while True:
             count = count + 1
             newname = '%s_%d%s' % (name, count, ext)
-            if not os.path.exists(os.path.join(target_folder, newname)):
+            if not os.path.exists(self.path(newname, folder)):
                 return newname
 
+    def relayout(self):
+        """
+        This moves the set's files into the layout of the current sharding
+        configuration, in place, and yields the ``(old, new)`` absolute
+        paths of every file moved. Directories left empty are removed at
+        the end. Files saved while this runs may be moved too, but downloads
+        can miss a file while it is being moved, so run it while the app is
+        stopped or quiet. Internal (dot) folders are left where they are.
+        """
+        config = self.config
+        for root, dirs, files in os.walk(config.destination):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            relative_root = os.path.relpath(root, config.destination).replace(os.sep, '/')
+            for filename in files:
+                current = filename if relative_root == '.' else posixpath.join(relative_root, filename)
+                target = config.shard(config.unshard(current))
+                if target != current:
+                    old = os.path.join(config.destination, current)
+                    new = os.path.join(config.destination, target)
+                    os.makedirs(os.path.dirname(new), exist_ok=True)
+                    os.rename(old, new)
+                    yield old, new
+
+        for root, dirs, files in os.walk(config.destination, topdown=False):
+            if root != config.destination and not os.listdir(root):
+                os.rmdir(root)
+
 
 uploads_mod = Blueprint('_uploads', __name__, url_prefix='/_uploads')
 
@@ -461,7 +810,7 @@ def uploaded_file(setname, filename):
     config = current_app.upload_set_config.get(setname)
     if config is None:
         abort(404)
-    return send_from_directory(config.destination, filename)
+    return send_from_directory(config.destination, config.shard(filename))
 
 
 class TestingFileStorage(FileStorage):
@@ -1,16 +1,136 @@
+import hashlib
 import os
+import posixpath
 import re
-from typing import Union
+from time import time
+from typing import IO, Callable, Tuple, Union
+from uuid import uuid4
 from werkzeug.datastructures import FileStorage
 
-from libs.flask_uploads import UploadSet, IMAGES
+from db import db
+from libs import image_variants
+from libs.flask_uploads import UploadSet, UploadNotAllowed, IMAGES, CONFLICT_UUID
+from models.image import ImageModel
+from models.image_blob import ImageBlobModel
 
-IMAGE_SET = UploadSet("images", IMAGES)
+IMAGE_SET = UploadSet("images", IMAGES, conflict=CONFLICT_UUID)
+
+# Built once from the upload set's extensions instead of on every call
+ALLOWED_FORMATS = "|".join(IMAGE_SET.extensions)  # png|svg|jpe|jpg|jpeg
+FILENAME_REGEX = re.compile(rf"^[a-zA-Z0-9][a-zA-Z0-9_()-\.]*\.({ALLOWED_FORMATS})$")
+
+# Unfinished streamed uploads live here, inside the set's destination so
+# finishing an upload is a rename rather than a copy
+PARTS_FOLDER = ".parts"
+CHUNK_SIZE = 64 * 1024
+SNIFF_SIZE = 16
+
+# File signatures checked against the extension of streamed uploads
+MAGIC_NUMBERS = {
+    "jpg": (b"\xff\xd8\xff",),
+    "jpe": (b"\xff\xd8\xff",),
+    "jpeg": (b"\xff\xd8\xff",),
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "gif": (b"GIF87a", b"GIF89a"),
+    "bmp": (b"BM",),
+}
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class ImageContentMismatch(Exception):
+    pass
 
 
 def save_image(image: FileStorage, folder: str = None, name: str = None) -> str:
-    """Takes FileStorage and saves it to a folder"""
-    return IMAGE_SET.save(image, folder, name)
+    """Takes FileStorage and saves it to a folder, then queues its resized variants"""
+    image_path = IMAGE_SET.save(image, folder, name)
+    image_variants.generate_variants(get_path(image_path))
+    return image_path
+
+
+def delete_image(filename: str, folder: str) -> None:
+    """Delete an image from a folder along with its variants"""
+    image_path = get_path(filename, folder=folder)
+    os.remove(image_path)
+    image_variants.remove_variants(image_path)
+
+
+def store_image(image: FileStorage, user_id: int) -> str:
+    """
+    Save an upload into the content-addressed store and name it for the
+    user. Content that is already stored only costs a new name. Returns
+    the saved name including the user's folder, like `save_image`.
+    """
+    basename = IMAGE_SET.get_basename(image.filename)
+    if not IMAGE_SET.file_allowed(image, basename):
+        raise UploadNotAllowed()
+    digest = IMAGE_SET.save_blob(image)
+    return _add_stored_image(user_id, basename, digest, lambda: IMAGE_SET.save_blob(image))
+
+
+def _add_stored_image(user_id: int, basename: str, digest: str, restore: Callable[[], None]) -> str:
+    """
+    Name a stored blob for the user, committing right away. `restore`
+    writes the blob's file again, for when a delete of its last other name
+    removed the file after this upload found it in place (see `remove_blob`).
+    """
+    folder = f"user_{user_id}"
+    existing = ImageModel.find_by_name(user_id, basename)
+    if existing and existing.digest == digest:
+        return posixpath.join(folder, basename)     # the same image uploaded again
+    if existing:
+        name, ext = os.path.splitext(basename)
+        basename = f"{name}_{uuid4().hex}{ext}"
+    blob_path = IMAGE_SET.blob_path(digest)
+    ImageBlobModel.acquire(digest, os.path.getsize(blob_path))
+    ImageModel(user_id, basename, digest).save_to_db(commit=True)
+    # Once the reference is committed no delete removes the file any more,
+    # but one that started before may have
+    if not os.path.exists(blob_path):
+        restore()
+    image_variants.generate_variants(blob_path)
+    return posixpath.join(folder, basename)
+
+
+def get_blob_path(digest: str) -> str:
+    """Return the full path of a stored image's content"""
+    return IMAGE_SET.blob_path(digest)
+
+
+def remove_blob(digest: str) -> None:
+    """
+    Remove a released blob's file, unless it has been stored again since.
+    The file is first renamed out of the way, then the row is checked once
+    more: an upload that found the file in place before the rename and
+    committed its reference since gets it back, and one that looks after the
+    rename finds it missing and writes it again (see `_add_stored_image`).
+    """
+    if ImageBlobModel.find_by_digest(digest) is not None:
+        return
+    blob_path = IMAGE_SET.blob_path(digest)
+    tombstone = f"{blob_path}.{uuid4().hex}.deleted"
+    try:
+        os.rename(blob_path, tombstone)
+    except FileNotFoundError:
+        return
+    db.session.commit()     # end the read transaction, to see uploads committed since
+    if ImageBlobModel.find_by_digest(digest) is not None:
+        try:
+            os.link(tombstone, blob_path)
+        except FileExistsError:
+            pass    # already written again by the upload
+        os.remove(tombstone)
+        return
+    os.remove(tombstone)
+    image_variants.remove_variants(blob_path)
+
+
+def send_image_file(image_path: str, filename: str = None, mimetype: str = None, etag: str = None):
+    """Send an image file with validators and range support, see `UploadSet.send_file`"""
+    return IMAGE_SET.send_file(image_path, filename, mimetype, etag)
 
 
 def get_path(filename: str = None, folder: str = None) -> str:
@@ -18,14 +138,138 @@ def get_path(filename: str = None, folder: str = None) -> str:
     return IMAGE_SET.path(filename, folder)
 
 
-def find_image_any_format(filename: str, folder: str) -> Union[str, None]:
-    """Takes a filename and returns an image on any of the accepted formats."""
-    for _format in IMAGES:
-        image = f"{filename}.{_format}"
-        image_path = IMAGE_SET.path(filename=image, folder=folder)
-        if os.path.isfile(image_path):
-            return image_path
-    return None
+def content_matches_extension(head: bytes, extension: str) -> bool:
+    """Check the first bytes of a file against the signature of its extension."""
+    if extension == "svg":
+        return head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<")
+    return head.startswith(MAGIC_NUMBERS.get(extension, ()))
+
+
+def get_part_path(filename: str, folder: str) -> str:
+    """Where the unfinished streamed upload of `filename` into `folder` is kept."""
+    return IMAGE_SET.path(f"{folder}_{filename}.part", folder=PARTS_FOLDER)
+
+
+def get_part_size(filename: str, folder: str) -> int:
+    """How many bytes of a resumable upload have been received so far."""
+    try:
+        return os.path.getsize(get_part_path(filename, folder))
+    except FileNotFoundError:
+        return 0
+
+
+def has_image_part(filename: str, folder: str) -> bool:
+    return os.path.exists(get_part_path(filename, folder))
+
+
+def purge_image_parts(max_age: int, folder: str = None) -> Tuple[int, int]:
+    """
+    Remove the part files of uploads nobody wrote to for `max_age` seconds,
+    only those into `folder` if given. Returns how many were removed and
+    how many are still open.
+    """
+    prefix = f"{folder}_" if folder else ""
+    expire_before = time() - max_age
+    removed = remaining = 0
+    try:
+        entries = os.scandir(os.path.join(IMAGE_SET.config.destination, PARTS_FOLDER))
+    except FileNotFoundError:
+        return 0, 0
+    with entries:
+        for entry in entries:
+            if not (entry.name.startswith(prefix) and entry.name.endswith(".part")):
+                continue
+            try:
+                if entry.stat().st_mtime < expire_before:
+                    os.remove(entry.path)
+                    removed += 1
+                else:
+                    remaining += 1
+            except FileNotFoundError:
+                pass    # finished or removed meanwhile
+    return removed, remaining
+
+
+def write_image_part(
+    stream: IO[bytes], filename: str, folder: str, offset: int, max_size: int
+) -> Tuple[int, Union[str, None]]:
+    """
+    Stream the request body straight into the upload's part file, starting
+    at `offset`. The first bytes of the file are checked against the
+    extension and the upload is aborted as soon as it grows past
+    `max_size`; in both cases the part file is removed. Returns the size
+    received so far and, when the whole file came in this call, its
+    SHA-256 digest computed while writing.
+    """
+    part = get_part_path(filename, folder)
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+    extension = get_extension(filename)[1:].lower()
+    digest = hashlib.sha256() if offset == 0 else None
+    sniffed = offset != 0
+    head = b""
+    size = offset
+    error = None
+    with open(part, "wb" if offset == 0 else "ab") as target:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            size += len(chunk)
+            if size > max_size:
+                error = ImageTooLarge()
+                break
+            if not sniffed:
+                head += chunk
+                if len(head) >= SNIFF_SIZE:
+                    sniffed = True
+                    if not content_matches_extension(head, extension):
+                        error = ImageContentMismatch()
+                        break
+            if digest:
+                digest.update(chunk)
+            target.write(chunk)
+    if not error and not sniffed and not content_matches_extension(head, extension):
+        error = ImageContentMismatch()
+    if error:
+        os.remove(part)
+        raise error
+    return size, digest.hexdigest() if digest else None
+
+
+def finish_image_part(filename: str, folder: str, digest: str = None) -> Tuple[str, str]:
+    """
+    Move a completely received upload into the user's folder. Returns the
+    saved path and the file's SHA-256 digest (hashed from disk when the
+    upload came in several chunks).
+    """
+    part = get_part_path(filename, folder)
+    digest = digest or _file_digest(part)
+    image_path = IMAGE_SET.save_file(part, filename, folder)
+    image_variants.generate_variants(get_path(image_path))
+    return image_path, digest
+
+
+def store_image_part(filename: str, folder: str, user_id: int, digest: str = None) -> Tuple[str, str]:
+    """Like `finish_image_part`, but moves the upload into the content-addressed store."""
+    basename = IMAGE_SET.get_basename(filename)
+    if not IMAGE_SET.extension_allowed(get_extension(basename)[1:]):
+        raise UploadNotAllowed()
+    part = get_part_path(filename, folder)
+    digest = digest or _file_digest(part)
+
+    def restore() -> None:
+        IMAGE_SET.save_file_blob(part, digest, keep_source=True)
+
+    restore()
+    try:
+        return _add_stored_image(user_id, basename, digest, restore), digest
+    finally:
+        os.remove(part)     # kept until the reference is committed, for `restore`
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 def _retrieve_filename(file: Union[str, FileStorage]) -> str:
@@ -43,9 +287,7 @@ def _retrieve_filename(file: Union[str, FileStorage]) -> str:
 def is_filename_safe(file: Union[str, FileStorage]) -> bool:
     """Check our regex and return whether the string matches or not"""
     filename = _retrieve_filename(file)
-    allowed_format = "|".join(IMAGES)  # png|svg|jpe|jpg|jpeg
-    regex = f"^[a-zA-Z0-9][a-zA-Z0-9_()-\.]*\.({allowed_format})$"
-    return re.match(regex, filename) is not None
+    return FILENAME_REGEX.match(filename) is not None
 
 
 def get_basename(file: Union[str, FileStorage]) -> str:
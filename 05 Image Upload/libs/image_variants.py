@@ -0,0 +1,185 @@
+"""
+libs.image_variants
+Resized copies of uploaded images, so list views can fetch a thumbnail
+instead of the full upload. Variants are cached on disk next to the
+original, in `.variants/{size}/{basename}` (plus `.webp` for the WebP
+copy), for each of the `IMAGE_VARIANT_SIZES` configured.
+Resizing is CPU bound, so it runs in a process pool: `generate_variants`
+queues every size right after an upload, and `get_variant` renders a
+missing one on demand and waits for it. Files Pillow can't read (e.g. SVG)
+get an empty marker in `.variants/unresizable/` instead, so they are served
+as they are without asking the pool again. A pool broken by a dying worker
+is replaced on the next call.
+"""
+
+import os
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Iterable
+
+from flask import current_app
+from PIL import Image, UnidentifiedImageError
+
+VARIANTS_FOLDER = ".variants"
+WEBP_EXTENSION = ".webp"
+UNRESIZABLE_FOLDER = "unresizable"
+
+_executor = None
+_executor_lock = Lock()
+
+
+def variant_path(path: str, size: int, webp: bool = False) -> str:
+    """Where the `size` variant of the image at `path` is cached."""
+    folder, basename = os.path.split(path)
+    if webp:
+        basename += WEBP_EXTENSION
+    return os.path.join(folder, VARIANTS_FOLDER, str(size), basename)
+
+
+def unresizable_marker(path: str) -> str:
+    """Where the note that the image at `path` can't be resized is kept."""
+    folder, basename = os.path.split(path)
+    return os.path.join(folder, VARIANTS_FOLDER, UNRESIZABLE_FOLDER, basename)
+
+
+def _mark_unresizable(path: str) -> None:
+    marker = unresizable_marker(path)
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    open(marker, "wb").close()
+    os.utime(marker)    # newer than the original, see `is_fresh`
+
+
+def render_variant(path: str, size: int, webp: bool = False) -> str:
+    """
+    Write the `size` variant of the image at `path`, fitting it in a
+    `size` x `size` box without enlarging it. Returns the variant's path,
+    or `path` itself for files Pillow can't resize (e.g. SVG), which are
+    marked as such. Runs in the pool's worker processes.
+    """
+    target = variant_path(path, size, webp)
+    # Written aside and renamed, so readers never see half a file
+    temporary = f"{target}.{os.getpid()}.tmp"
+    try:
+        with Image.open(path) as image:
+            image_format = "WEBP" if webp else image.format
+            image.thumbnail((size, size))
+            if webp and image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            image.save(temporary, format=image_format)
+        os.replace(temporary, target)
+        if not os.path.exists(path):
+            # the original was deleted while this variant was rendered
+            os.remove(target)
+            return path
+        return target
+    except UnidentifiedImageError:
+        _mark_unresizable(path)
+        return path
+    except (OSError, ValueError):
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return path
+
+
+def render_variants(path: str, sizes: Iterable[int], webp: bool = False) -> None:
+    for size in sizes:
+        if is_fresh(unresizable_marker(path), path):
+            return
+        for as_webp in ((False, True) if webp else (False,)):
+            if not is_fresh(variant_path(path, size, as_webp), path):
+                render_variant(path, size, as_webp)
+
+
+def is_fresh(target: str, path: str) -> bool:
+    """True if the variant `target` exists and isn't older than the original."""
+    try:
+        return os.path.getmtime(target) >= os.path.getmtime(path)
+    except FileNotFoundError:
+        return False
+
+
+def generate_variants(path: str) -> None:
+    """
+    Queue every configured variant of the image at `path` without waiting.
+    Never fails the upload: whatever isn't rendered now is on demand.
+    """
+    config = current_app.config
+    try:
+        _submit(render_variants, path, config["IMAGE_VARIANT_SIZES"], config["IMAGE_VARIANT_WEBP"])
+    except Exception:
+        traceback.print_exc()
+
+
+def get_variant(path: str, size: int, webp: bool = False) -> str:
+    """
+    Return the path of the `size` variant of the image at `path`, rendering
+    it first if it is missing or stale. Falls back to the original if the
+    pool can't render it in `IMAGE_VARIANT_TIMEOUT` seconds.
+    Raises `FileNotFoundError` if the original doesn't exist.
+    """
+    os.stat(path)
+    target = variant_path(path, size, webp)
+    if is_fresh(target, path):
+        return target
+    if is_fresh(unresizable_marker(path), path):
+        return path
+    try:
+        return _submit(render_variant, path, size, webp).result(
+            timeout=current_app.config["IMAGE_VARIANT_TIMEOUT"]
+        )
+    except Exception:
+        traceback.print_exc()
+        return path
+
+
+def remove_variants(path: str) -> None:
+    """Remove the cached variants of an image that was deleted or replaced."""
+    paths = [unresizable_marker(path)]
+    for size in current_app.config["IMAGE_VARIANT_SIZES"]:
+        for webp in (False, True):
+            paths.append(variant_path(path, size, webp))
+    for variant in paths:
+        try:
+            os.remove(variant)
+        except FileNotFoundError:
+            pass
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=current_app.config["IMAGE_VARIANT_WORKERS"]
+                )
+    return _executor
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    # a broken pool has already shut itself down, the next `_pool()` makes a new one
+    global _executor
+    with _executor_lock:
+        if _executor is pool:
+            _executor = None
+
+
+def _submit(fn, *args) -> Future:
+    """Submit to the pool, replacing it first if a dead worker broke it."""
+    pool = _pool()
+    try:
+        future = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        pool = _pool()
+        future = pool.submit(fn, *args)
+
+    def discard_if_broken(done: Future) -> None:
+        if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+            _discard_pool(pool)
+
+    future.add_done_callback(discard_if_broken)
+    return future
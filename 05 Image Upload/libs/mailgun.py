@@ -1,5 +1,7 @@
-from requests import Response, post
-from typing import List
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from typing import Dict, List
+import json
 import os
 from libs.strings import gettext
 
@@ -12,30 +14,86 @@ class MailGunException(Exception):
 class Mailgun:
     MAILGUN_DOMAIN = os.environ.get("MAILGUN_DOMAIN")
     MAILGUN_API_KEY = os.environ.get("MAILGUN_API_KEY")
+    # Point at a local fake Mailgun server when developing
+    MAILGUN_API_URL = os.environ.get("MAILGUN_API_URL", "https://api.mailgun.net/v3")
+    POOL_SIZE = int(os.environ.get("MAILGUN_POOL_SIZE", 10))
+    CONNECT_TIMEOUT = float(os.environ.get("MAILGUN_CONNECT_TIMEOUT", 5))
+    READ_TIMEOUT = float(os.environ.get("MAILGUN_READ_TIMEOUT", 30))
+    BATCH_SIZE = 1000   # Mailgun's recipient limit per batch message
     FROM_TITLE = "Store REST API"
     FROM_EMAIL = f"do-not-reply@{MAILGUN_DOMAIN}"
 
+    _session = None
+
     @classmethod
-    def send_email(cls, email: List[str], subject: str, text: str, html: str) -> Response:
+    def session(cls) -> Session:
+        """Shared keep-alive session, so sends reuse pooled TCP/TLS connections."""
+        if cls._session is None:
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.auth = ("api", cls.MAILGUN_API_KEY)
+            cls._session = session
+        return cls._session
 
+    @classmethod
+    def check_config(cls) -> None:
         if cls.MAILGUN_API_KEY is None:
             raise MailGunException(gettext("mailgun_failed_load_api_key"))
 
         if cls.MAILGUN_DOMAIN is None:
             raise MailGunException(gettext("mailgun_failed_load_domain"))
 
-        response = post(
-            f"https://api.mailgun.net/v3/{cls.MAILGUN_DOMAIN}/messages",
-            auth=("api", cls.MAILGUN_API_KEY),
-            data={
-                "from": f"{cls.FROM_TITLE}<{cls.FROM_EMAIL}>",
-                "to": email,
-                "subject": subject,
-                "text": text,
-                "html": html
-            },
+    @classmethod
+    def _post(cls, data: Dict) -> Response:
+        cls.check_config()
+
+        response = cls.session().post(
+            f"{cls.MAILGUN_API_URL}/{cls.MAILGUN_DOMAIN}/messages",
+            data={"from": f"{cls.FROM_TITLE}<{cls.FROM_EMAIL}>", **data},
+            timeout=(cls.CONNECT_TIMEOUT, cls.READ_TIMEOUT),
         )
 
         if response.status_code != 200:
             raise MailGunException(gettext("mailgun_error_send_email"))
         return response
+
+    @classmethod
+    def send_email(cls, email: List[str], subject: str, text: str, html: str) -> Response:
+        return cls._post({
+            "to": email,
+            "subject": subject,
+            "text": text,
+            "html": html
+        })
+
+    @classmethod
+    def send_batch(
+        cls,
+        recipient_variables: Dict[str, Dict[str, str]],
+        subject: str,
+        text: str,
+        html: str
+    ) -> List[Response]:
+        """
+        Send one message per recipient using Mailgun batch sending.
+        `recipient_variables` maps each email address to the values
+        substituted for `%recipient.<key>%` placeholders in the body,
+        e.g. {"a@b.com": {"link": "..."}}. Recipients are sent in chunks
+        of `BATCH_SIZE`, one API call per chunk.
+        """
+        emails = list(recipient_variables)
+        responses = []
+        for start in range(0, len(emails), cls.BATCH_SIZE):
+            chunk = emails[start:start + cls.BATCH_SIZE]
+            responses.append(cls._post({
+                "to": chunk,
+                "subject": subject,
+                "text": text,
+                "html": html,
+                "recipient-variables": json.dumps(
+                    {email: recipient_variables[email] for email in chunk}
+                ),
+            }))
+        return responses
@@ -0,0 +1,109 @@
+"""
+libs.outbox
+Delivers queued emails from the `email_outbox` table off the request path.
+Request handlers call `queue_email`, which only inserts a row; an
+`OutboxWorker` polls for due rows and sends them through Mailgun,
+retrying failures with exponential backoff.
+Web servers (`flask run`, gunicorn, ...) don't start a worker: run
+`flask outbox-worker` as its own process next to them, or nothing is sent.
+Only `python app.py` starts one in a thread (`EMAIL_OUTBOX_WORKER`).
+Several workers can run at once, rows are claimed with a lease.
+Due single-recipient emails with the same subject (e.g. confirmation mails)
+go out in one Mailgun batch call, each recipient's own text and html passed
+as recipient variables.
+"""
+
+import traceback
+from threading import Event, Thread
+from typing import Dict, List
+
+from requests import RequestException
+
+from libs.mailgun import Mailgun, MailGunException
+from models.outbox import EmailOutboxModel
+
+
+def queue_email(email: List[str], subject: str, text: str, html: str) -> EmailOutboxModel:
+    Mailgun.check_config()
+    message = EmailOutboxModel(email, subject, text, html)
+    message.save_to_db()
+    return message
+
+
+class OutboxWorker(Thread):
+    def __init__(self, app):
+        super().__init__(name="email-outbox", daemon=True)
+        self.app = app
+        self.poll_interval = app.config["EMAIL_OUTBOX_POLL_INTERVAL"]
+        self.batch_size = app.config["EMAIL_OUTBOX_BATCH_SIZE"]
+        self.max_attempts = app.config["EMAIL_OUTBOX_MAX_ATTEMPTS"]
+        self.backoff = app.config["EMAIL_OUTBOX_BACKOFF"]
+        self.lease = app.config["EMAIL_OUTBOX_LEASE"]
+        self._stop_event = Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    sent = self.process_batch()
+            except Exception:
+                traceback.print_exc()
+                sent = 0
+            if sent < self.batch_size:
+                self._stop_event.wait(self.poll_interval)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def drain(self) -> int:
+        """Send due emails until none are left, returns how many were processed."""
+        processed = 0
+        while True:
+            with self.app.app_context():
+                sent = self.process_batch()
+            processed += sent
+            if sent < self.batch_size:
+                return processed
+
+    def process_batch(self) -> int:
+        """Send every due email, returns how many were processed."""
+        messages = EmailOutboxModel.find_due(self.batch_size, self.max_attempts)
+        groups: Dict[str, Dict[str, EmailOutboxModel]] = {}    # subject -> address -> message
+        for message in messages:
+            if not message.claim(self.lease):
+                continue
+            email = message.email
+            group = groups.setdefault(message.subject, {})
+            if len(email) == 1 and email[0] not in group:
+                group[email[0]] = message
+            else:
+                self._send([message])
+        for group in groups.values():
+            self._send(list(group.values()))
+        return len(messages)
+
+    def _send(self, messages: List[EmailOutboxModel]) -> None:
+        try:
+            if len(messages) == 1:
+                message = messages[0]
+                Mailgun.send_email(message.email, message.subject, message.text, message.html)
+            else:
+                Mailgun.send_batch(
+                    {
+                        message.email[0]: {"text": message.text, "html": message.html}
+                        for message in messages
+                    },
+                    messages[0].subject, "%recipient.text%", "%recipient.html%",
+                )
+        except (MailGunException, RequestException) as e:
+            for message in messages:
+                message.mark_failed(str(e), self.backoff)
+        else:
+            for message in messages:
+                message.mark_sent()
+
+
+def start_worker(app) -> OutboxWorker:
+    worker = OutboxWorker(app)
+    worker.start()
+    return worker
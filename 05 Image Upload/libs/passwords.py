@@ -0,0 +1,114 @@
+"""
+libs.passwords
+Password hashing with scrypt. Cost parameters come from the app config
+(`PASSWORD_SCRYPT_N/R/P`) and are stored in every hash, so hashes made with
+old parameters can be detected and upgraded on the next login.
+Hashing and verification run on a bounded thread pool via `run`, so a burst
+of logins can only occupy `PASSWORD_HASH_WORKERS` threads worth of CPU.
+Logins for unknown users are checked against a dummy hash (`verify_dummy`),
+so response times don't reveal which usernames exist.
+"""
+
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import Lock
+from typing import Callable, Dict, Tuple, TypeVar
+
+from flask import current_app
+
+PREFIX = "scrypt"
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+T = TypeVar("T")
+
+_executor = None
+_executor_lock = Lock()
+_dummy_hashes: Dict[Tuple[int, int, int], str] = {}
+
+
+def _params() -> Tuple[int, int, int]:
+    config = current_app.config
+    return config["PASSWORD_SCRYPT_N"], config["PASSWORD_SCRYPT_R"], config["PASSWORD_SCRYPT_P"]
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r * p, dklen=KEY_SIZE,
+    )
+
+
+def hash_password(password: str) -> str:
+    """Return `scrypt$n$r$p$salt$hash` for the given password."""
+    n, r, p = _params()
+    salt = os.urandom(SALT_SIZE)
+    key = _scrypt(password, salt, n, r, p)
+    return f"{PREFIX}${n}${r}${p}${salt.hex()}${key.hex()}"
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """
+    Check a password against a stored hash. Passwords stored before hashing
+    was introduced are compared as plain text.
+    """
+    if not hashed.startswith(PREFIX + "$"):
+        return hmac.compare_digest(password.encode("utf-8"), hashed.encode("utf-8"))
+    _, n, r, p, salt, key = hashed.split("$")
+    candidate = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(candidate, bytes.fromhex(key))
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True for plain text passwords and hashes made with other parameters."""
+    if not hashed.startswith(PREFIX + "$"):
+        return True
+    n, r, p = (int(value) for value in hashed.split("$")[1:4])
+    return (n, r, p) != _params()
+
+
+def _verify_dummy(password: str) -> bool:
+    params = _params()
+    if params not in _dummy_hashes:
+        _dummy_hashes[params] = hash_password(os.urandom(KEY_SIZE).hex())
+    verify_password(password, _dummy_hashes[params])
+    return False
+
+
+def verify_dummy(password: str) -> bool:
+    """
+    Do the work of `verify_password` on the pool for a user that doesn't
+    exist, against a hash made with the current parameters. Always False.
+    """
+    return run(_verify_dummy, password)
+
+
+def run(func: Callable[..., T], *args) -> T:
+    """
+    Run `func` on the password pool and wait for the result.
+    Raises `concurrent.futures.TimeoutError` if the pool is too busy to
+    finish within `PASSWORD_HASH_TIMEOUT` seconds; the call is then
+    cancelled, unless it has already started, so it doesn't hold up later ones.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config["PASSWORD_HASH_WORKERS"],
+                    thread_name_prefix="password-hash",
+                )
+    app = current_app._get_current_object()
+
+    def call():
+        with app.app_context():
+            return func(*args)
+
+    future = _executor.submit(call)
+    try:
+        return future.result(timeout=current_app.config["PASSWORD_HASH_TIMEOUT"])
+    except TimeoutError:
+        future.cancel()
+        raise
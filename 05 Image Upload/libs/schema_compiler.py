@@ -0,0 +1,139 @@
+"""
+libs.schema_compiler
+Specialized dump functions for marshmallow schemas. Stock marshmallow
+serializes every field of every object through generic hooks (accessor,
+`serialize`, `_serialize`, missing checks), which dominates list endpoints.
+`compile_dump` generates Python source for one schema instead: a single
+function reading each attribute directly and converting it inline.
+Fields without an inline conversion (e.g. `Method`) still go through their
+own `serialize`, and schemas with `pre_dump`/`post_dump` hooks aren't
+compiled at all. Add `CompiledDumpMixin` to a schema to use it for
+`many=True` dumps.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from marshmallow import Schema, fields, missing
+from sqlalchemy import inspect
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow.utils import ensure_text_type
+
+DumpMany = Callable[[Iterable[Any]], List[Dict[str, Any]]]
+
+# Field class -> expression converting the (not None) value `{v}`, the
+# same way the field's `_serialize` does
+CONVERTERS = {
+    fields.Integer: "{v} if {v}.__class__ is int else int({v})",
+    fields.Float: "{v} if {v}.__class__ is float else float({v})",
+    fields.String: "{v} if {v}.__class__ is str else _text({v})",
+}
+
+
+def _converter(field: fields.Field) -> Optional[str]:
+    if getattr(field, "as_string", False):
+        return None
+    for field_class, expression in CONVERTERS.items():
+        if type(field) is field_class:
+            return expression
+    return None
+
+
+def _drop_missing(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in row.items() if value is not missing}
+
+
+def dumped_columns(schema: Schema, model) -> List[str]:
+    """
+    The columns of `model` that `schema` dumps, in dump order, for queries
+    selecting just those instead of whole model instances.
+    """
+    columns = inspect(model).column_attrs.keys()
+    attributes = [field.attribute or name for name, field in schema.dump_fields.items()]
+    return [attribute for attribute in attributes if attribute in columns]
+
+
+def compile_dump(schema: Schema) -> Optional[DumpMany]:
+    """
+    Generate a function dumping a list of objects exactly like
+    `schema.dump(objs, many=True)`. Objects are read by attribute, so it
+    works for models and row tuples, not dicts, and raises AttributeError
+    where marshmallow would leave the field out. Returns None if the schema
+    has dump hooks.
+    """
+    if schema._has_processors(PRE_DUMP) or schema._has_processors(POST_DUMP):
+        return None
+
+    namespace = {"_text": ensure_text_type, "_drop_missing": _drop_missing}
+    lines = []
+    items = []
+    generic = False
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else name
+        attribute = field.attribute or name
+        value = f"v{index}"
+        converter = _converter(field)
+        nested = None
+        if isinstance(field, fields.Nested) and isinstance(field.schema, CompiledDumpMixin):
+            nested = field.schema.compiled_dump()
+        if attribute.isidentifier() and converter:
+            lines.append(f"{value} = obj.{attribute}")
+            expression = converter.format(v=value)
+            items.append(f"{key!r}: None if {value} is None else {expression}")
+        elif attribute.isidentifier() and nested:
+            namespace[f"nested{index}"] = nested
+            lines.append(f"{value} = obj.{attribute}")
+            if field.schema.many or field.many:
+                expression = f"nested{index}({value})"
+            else:
+                expression = f"nested{index}(({value},))[0]"
+            items.append(f"{key!r}: None if {value} is None else {expression}")
+        else:
+            # no inline version: the field serializes itself, with its hooks
+            generic = True
+            namespace[f"field{index}"] = field
+            namespace[f"name{index}"] = name
+            items.append(f"{key!r}: field{index}.serialize(name{index}, obj, _get)")
+    namespace["_get"] = schema.get_attribute
+
+    row = "{" + ", ".join(items) + "}"
+    if generic:
+        row = f"_drop_missing({row})"
+    body = "".join(f"\n        {line}" for line in lines)
+    source = (
+        "def dump_many(objs):"
+        "\n    rows = []"
+        "\n    append = rows.append"
+        "\n    for obj in objs:"
+        f"{body}"
+        f"\n        append({row})"
+        "\n    return rows"
+    )
+    exec(compile(source, f"<compiled dump of {type(schema).__name__}>", "exec"), namespace)
+    return namespace["dump_many"]
+
+
+class CompiledDumpMixin:
+    """
+    Dumps `many=True` through a function compiled for the schema on first
+    use. Single objects, and schemas that can't be compiled, go through
+    marshmallow as usual. Set `CompiledDumpMixin.compile_dumps = False` to
+    turn it off everywhere.
+    """
+    compile_dumps = True
+    _compiled = None
+
+    def compiled_dump(self) -> Optional[DumpMany]:
+        if self._compiled is None:
+            self._compiled = compile_dump(self) or False
+        return self._compiled or None
+
+    def dump(self, obj: Any, *, many: bool = None):
+        many = self.many if many is None else bool(many)
+        if many and self.compile_dumps:
+            dump_many = self.compiled_dump()
+            if dump_many is not None:
+                try:
+                    return dump_many(obj)
+                except AttributeError:
+                    pass    # marshmallow leaves out attributes an object lacks
+        return super().dump(obj, many=many)
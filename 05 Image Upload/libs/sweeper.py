@@ -0,0 +1,82 @@
+"""
+libs.sweeper
+Removes confirmations that can never be used again: expired rows that are
+no longer their user's current confirmation. Rows are deleted in small
+batches, each in its own short transaction, so the SQLite write lock is
+never held for long. Run it with `flask purge-confirmations` or let
+`ConfirmationSweeper` do it periodically.
+"""
+
+import traceback
+from threading import Event, Thread
+from time import perf_counter, sleep, time
+from typing import Dict, List
+
+from flask import current_app
+
+from db import db
+from models.confirmation import ConfirmationModel
+from models.user import UserModel
+
+
+def _stale_confirmation_ids(batch_size: int) -> List[str]:
+    current = db.session.query(UserModel.current_confirmation_id).filter(
+        UserModel.current_confirmation_id.isnot(None)
+    )
+    return [
+        _id for _id, in db.session.query(ConfirmationModel.id)
+        .filter(ConfirmationModel.expire_at < int(time()), ConfirmationModel.id.notin_(current))
+        .limit(batch_size)
+    ]
+
+
+def purge_confirmations(batch_size: int, pause: float = 0) -> Dict[str, float]:
+    """Delete stale confirmations in batches, returns what was done and how long it took."""
+    started = perf_counter()
+    removed = batches = 0
+    while True:
+        ids = _stale_confirmation_ids(batch_size)
+        if not ids:
+            db.session.rollback()
+            break
+        removed += ConfirmationModel.query.filter(ConfirmationModel.id.in_(ids)).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        sleep(pause)
+    return {"removed": removed, "batches": batches, "seconds": round(perf_counter() - started, 3)}
+
+
+class ConfirmationSweeper(Thread):
+    def __init__(self, app):
+        super().__init__(name="confirmation-sweeper", daemon=True)
+        self.app = app
+        self.interval = app.config["CONFIRMATION_SWEEP_INTERVAL"]
+        self.batch_size = app.config["CONFIRMATION_SWEEP_BATCH_SIZE"]
+        self.pause = app.config["CONFIRMATION_SWEEP_PAUSE"]
+        self.total_removed = 0
+        self.total_seconds = 0.0
+        self._stop_event = Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    stats = purge_confirmations(self.batch_size, self.pause)
+                    current_app.logger.info("Confirmation sweep: %s", stats)
+                self.total_removed += stats["removed"]
+                self.total_seconds += stats["seconds"]
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def start_sweeper(app) -> ConfirmationSweeper:
+    sweeper = ConfirmationSweeper(app)
+    sweeper.start()
+    return sweeper
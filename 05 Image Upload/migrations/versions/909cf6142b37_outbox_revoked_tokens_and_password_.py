@@ -0,0 +1,62 @@
+"""outbox, revoked tokens and password hash length
+
+Revision ID: 909cf6142b37
+Revises: 9e33e8bb4503
+Create Date: 2026-10-18 16:02:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '909cf6142b37'
+down_revision = '9e33e8bb4503'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the app's create_all may already have made these two tables
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'email_outbox' not in tables:
+        op.create_table('email_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('recipients', sa.Text(), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('html', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.Integer(), nullable=False),
+        sa.Column('sent_at', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_email_outbox_next_attempt_at'), 'email_outbox', ['next_attempt_at'], unique=False)
+        op.create_index(op.f('ix_email_outbox_sent_at'), 'email_outbox', ['sent_at'], unique=False)
+    if 'revoked_tokens' not in tables:
+        op.create_table('revoked_tokens',
+        sa.Column('jti', sa.String(length=120), nullable=False),
+        sa.Column('expire_at', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('jti')
+        )
+        op.create_index(op.f('ix_revoked_tokens_expire_at'), 'revoked_tokens', ['expire_at'], unique=False)
+    # password hashes are longer than the 80 characters plain passwords had
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('password',
+                              existing_type=sa.String(length=80),
+                              type_=sa.String(length=255),
+                              existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('password',
+                              existing_type=sa.String(length=255),
+                              type_=sa.String(length=80),
+                              existing_nullable=False)
+    op.drop_index(op.f('ix_revoked_tokens_expire_at'), table_name='revoked_tokens')
+    op.drop_table('revoked_tokens')
+    op.drop_index(op.f('ix_email_outbox_sent_at'), table_name='email_outbox')
+    op.drop_index(op.f('ix_email_outbox_next_attempt_at'), table_name='email_outbox')
+    op.drop_table('email_outbox')
@@ -0,0 +1,47 @@
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+
+
+class CollectionVersionModel(db.Model):
+    """
+    A counter per collection ("items", "stores"), raised on every change to
+    one of its rows. Its value is the collection's ETag, and changed rows
+    take it as their own `version`, so versions are never reused, even for
+    a row deleted and created again under the same name.
+    """
+    __tablename__ = "collection_versions"
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def find_version(cls, name: str) -> int:
+        """
+        The current version of a collection. Not cached: it is one
+        primary-key lookup, and a cached copy would go stale in every
+        process but the writer's.
+        """
+        version = db.session.query(cls.version).filter_by(name=name).scalar()
+        return version or 0
+
+    @classmethod
+    def bump(cls, name: str) -> int:
+        """Raise a collection's version in the current transaction and return it."""
+        # Done in SQL, which also locks the row until commit, so concurrent
+        # writers get distinct versions
+        updated = (
+            cls.query.filter_by(name=name)
+            .update({"version": cls.version + 1}, synchronize_session=False)
+        )
+        if not updated:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(cls(name=name, version=1))
+                return 1
+            except IntegrityError:
+                # created by a concurrent writer
+                cls.query.filter_by(name=name).update(
+                    {"version": cls.version + 1}, synchronize_session=False
+                )
+        return cls.find_version(name)
@@ -1,4 +1,4 @@
-from db import db
+from db import db, save_changes
 from uuid import uuid4
 from time import time
 
@@ -8,12 +8,16 @@ CONFIRMAION_EXPIRATION_DELTA = 1800     # 30 min
 
 class ConfirmationModel(db.Model):
     __tablename__ = "confirmations"
+    __table_args__ = (
+        # Serves "latest confirmation of a user" without sorting
+        db.Index("ix_confirmations_user_id_expire_at", "user_id", "expire_at"),
+    )
 
     id = db.Column(db.String(50), primary_key=True)
     expire_at = db.Column(db.Integer, nullable=False)
     confirmed = db.Column(db.Boolean, nullable=False, default=False)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    user = db.relationship("UserModel")
+    user = db.relationship("UserModel", foreign_keys=[user_id])
 
     def __init__(self, user_id: int, **kwargs):
         super().__init__(**kwargs)
@@ -34,10 +38,10 @@ class ConfirmationModel(db.Model):
             self.expire_at = int(time())
             self.save_to_db()
 
-    def save_to_db(self) -> None:
+    def save_to_db(self, commit: bool = False) -> None:
         db.session.add(self)
-        db.session.commit()
+        save_changes(commit)
 
-    def delete_from_db(self) -> None:
+    def delete_from_db(self, commit: bool = False) -> None:
         db.session.delete(self)
-        db.session.commit()
\ No newline at end of file
+        save_changes(commit)
\ No newline at end of file
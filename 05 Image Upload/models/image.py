@@ -0,0 +1,44 @@
+from db import db, save_changes
+from models.image_blob import ImageBlobModel
+
+
+class ImageModel(db.Model):
+    """
+    A user's name for an image in the content-addressed store. Several
+    names, of the same or different users, can share one blob.
+    """
+    __tablename__ = "images"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "name", name="uq_images_user_id_name"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    digest = db.Column(db.String(64), db.ForeignKey("image_blobs.digest"), nullable=False)
+    blob = db.relationship("ImageBlobModel")
+
+    def __init__(self, user_id: int, name: str, digest: str, **kwargs):
+        super().__init__(**kwargs)
+        self.user_id = user_id
+        self.name = name
+        self.digest = digest
+
+    @classmethod
+    def find_by_name(cls, user_id: int, name: str) -> "ImageModel":
+        return cls.query.filter_by(user_id=user_id, name=name).first()
+
+    def save_to_db(self, commit: bool = False) -> None:
+        db.session.add(self)
+        save_changes(commit)
+
+    def delete_from_db(self, commit: bool = False) -> bool:
+        """
+        Delete the name and release its blob. Returns True if no other name
+        uses the blob, so its file can be removed after the commit.
+        """
+        db.session.delete(self)
+        db.session.flush()
+        orphaned = ImageBlobModel.release(self.digest)
+        save_changes(commit)
+        return orphaned
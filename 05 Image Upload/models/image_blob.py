@@ -0,0 +1,54 @@
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+
+
+class ImageBlobModel(db.Model):
+    """
+    A file in the content-addressed image store, named by its SHA-256.
+    `ref_count` is the number of `ImageModel` names pointing at it; once it
+    drops to zero the row is deleted and the file can be removed.
+    """
+    __tablename__ = "image_blobs"
+
+    digest = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def find_by_digest(cls, digest: str) -> "ImageBlobModel":
+        return cls.query.filter_by(digest=digest).first()
+
+    @classmethod
+    def acquire(cls, digest: str, size: int) -> None:
+        """Add a reference to a blob, creating its row on first use."""
+        if cls._add_ref(digest, 1):
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.add(cls(digest=digest, size=size, ref_count=1))
+        except IntegrityError:
+            # created by a concurrent upload of the same content
+            cls._add_ref(digest, 1)
+
+    @classmethod
+    def release(cls, digest: str) -> bool:
+        """
+        Drop a reference to a blob. Returns True if it was the last one:
+        the row is deleted and the file can go once this is committed.
+        """
+        cls._add_ref(digest, -1)
+        deleted = (
+            cls.query.filter(cls.digest == digest, cls.ref_count <= 0)
+            .delete(synchronize_session=False)
+        )
+        return deleted == 1
+
+    @classmethod
+    def _add_ref(cls, digest: str, delta: int) -> bool:
+        # Done in SQL so concurrent uploads and deletes don't lose counts
+        updated = (
+            cls.query.filter_by(digest=digest)
+            .update({"ref_count": cls.ref_count + delta}, synchronize_session=False)
+        )
+        return updated == 1
@@ -1,5 +1,7 @@
-from db import db
-from typing import  List
+from db import db, save_changes, invalidate_on_commit
+from typing import List, Iterator, Sequence, Tuple
+from models.collection_version import CollectionVersionModel
+from models.store import StoreModel
 
 
 class ItemModel(db.Model):
@@ -9,6 +11,8 @@ class ItemModel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
     price = db.Column(db.Float(precision=2), nullable=False)
+    # "items" collection version of the last change, see CollectionVersionModel
+    version = db.Column(db.Integer, nullable=False, default=0)
 
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
     store = db.relationship('StoreModel')
@@ -21,10 +25,113 @@ class ItemModel(db.Model):
     def find_all(cls) -> List['ItemModel']:
         return cls.query.all()
 
-    def save_to_db(self) -> None:
+    @classmethod
+    def query_columns(cls, columns: Sequence[str]):
+        """
+        Read-only query returning row tuples of just `columns` (readable
+        by attribute, like the model), without building ItemModel
+        instances, the identity map entries or change tracking.
+        """
+        return db.session.query(*[getattr(cls, column) for column in columns])
+
+    @classmethod
+    def find_row_by_name(cls, name: str, columns: Sequence[str]):
+        return cls.query_columns(columns).filter(cls.name == name).first()
+
+    @classmethod
+    def find_page_rows(cls, columns: Sequence[str], limit: int, after: int = None) -> List:
+        """
+        Keyset pagination on `items.id`: returns at most `limit` rows of
+        `columns` for items whose id is greater than `after`, ordered by id.
+        """
+        query = cls.query_columns(columns).order_by(cls.id)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.limit(limit).all()
+
+    @classmethod
+    def iter_rows(cls, columns: Sequence[str], batch_size: int = 1000) -> Iterator:
+        """
+        Iterate over rows of `columns` for every item ordered by id, fetching
+        `batch_size` rows at a time from the cursor instead of loading the
+        whole table.
+        """
+        return cls.query_columns(columns).order_by(cls.id).yield_per(batch_size)
+
+    @classmethod
+    def bulk_upsert(cls, items: List[dict], chunk_size: int, commit: bool = False) -> Tuple[int, int]:
+        """
+        Insert new items and update existing ones, matched by name, using
+        bulk mappings `chunk_size` rows at a time, all in the current
+        transaction. Items identical to the stored row aren't written.
+        Versions, caches and the stores involved are only touched for rows
+        that were written. Returns (inserted, updated).
+        """
+        inserted = updated = 0
+        names = set()
+        store_ids = set()
+        version = None
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            existing = {
+                name: (_id, store_id, price)
+                for name, _id, store_id, price in db.session.query(cls.name, cls.id, cls.store_id, cls.price)
+                .filter(cls.name.in_([item["name"] for item in chunk]))
+            }
+            new_items = [item for item in chunk if item["name"] not in existing]
+            changed_items = [
+                item for item in chunk
+                if item["name"] in existing
+                and existing[item["name"]][1:] != (item["store_id"], item["price"])
+            ]
+            if not new_items and not changed_items:
+                continue
+            if version is None:
+                version = CollectionVersionModel.bump("items")
+            db.session.bulk_insert_mappings(cls, [dict(item, version=version) for item in new_items])
+            db.session.bulk_update_mappings(cls, [
+                dict(item, id=existing[item["name"]][0], version=version) for item in changed_items
+            ])
+            inserted += len(new_items)
+            updated += len(changed_items)
+            for item in new_items + changed_items:
+                names.add(item["name"])
+                store_ids.add(item["store_id"])
+            # an item moved to another store changes the old one too
+            store_ids.update(existing[item["name"]][1] for item in changed_items)
+
+        if store_ids:
+            StoreModel.touch(*store_ids)
+            stores = db.session.query(StoreModel.name).filter(StoreModel.id.in_(store_ids))
+            invalidate_on_commit(
+                *[cls.cache_key(name) for name in names],
+                *[StoreModel.cache_key(name) for name, in stores]
+            )
+        save_changes(commit)
+        return inserted, updated
+
+    @staticmethod
+    def cache_key(name: str) -> str:
+        return f"item:{name}"
+
+    def _cache_keys(self) -> List[str]:
+        """The cached item and the cached store that nests it."""
+        keys = [self.cache_key(self.name)]
+        store = self.store or StoreModel.query.get(self.store_id)
+        if store:
+            keys.append(StoreModel.cache_key(store.name))
+        return keys
+
+    def save_to_db(self, commit: bool = False) -> None:
+        invalidate_on_commit(*self._cache_keys())
+        self.version = CollectionVersionModel.bump("items")
+        StoreModel.touch(self.store_id)
         db.session.add(self)
-        db.session.commit()
+        save_changes(commit)
     
-    def delete_from_db(self):
+    def delete_from_db(self, commit: bool = False) -> None:
+        invalidate_on_commit(*self._cache_keys())
+        CollectionVersionModel.bump("items")
+        StoreModel.touch(self.store_id)
         db.session.delete(self)
-        db.session.commit()
+        save_changes(commit)
@@ -0,0 +1,85 @@
+import json
+from time import time
+from typing import List
+
+from db import db, save_changes
+
+
+class EmailOutboxModel(db.Model):
+    """
+    Emails waiting to be delivered by `libs.outbox.OutboxWorker`.
+    `next_attempt_at` doubles as a lease: a worker claims a row by moving it
+    forward, so the same email isn't sent twice by concurrent workers.
+    """
+    __tablename__ = "email_outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipients = db.Column(db.Text, nullable=False)     # JSON list
+    subject = db.Column(db.String(255), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.Integer, nullable=False, index=True)
+    sent_at = db.Column(db.Integer, index=True)
+    last_error = db.Column(db.Text)
+
+    def __init__(self, email: List[str], subject: str, text: str, html: str, **kwargs):
+        super().__init__(**kwargs)
+        self.recipients = json.dumps(email)
+        self.subject = subject
+        self.text = text
+        self.html = html
+        self.attempts = 0
+        self.next_attempt_at = int(time())
+
+    @property
+    def email(self) -> List[str]:
+        return json.loads(self.recipients)
+
+    @classmethod
+    def find_due(cls, limit: int, max_attempts: int) -> List["EmailOutboxModel"]:
+        return (
+            cls.query.filter(
+                cls.sent_at.is_(None),
+                cls.attempts < max_attempts,
+                cls.next_attempt_at <= int(time()),
+            )
+            .order_by(cls.next_attempt_at)
+            .limit(limit)
+            .all()
+        )
+
+    def claim(self, lease: int) -> bool:
+        """
+        Atomically take the row for `lease` seconds. False if another worker
+        got it. Checked against the row as it is now, not as `find_due` saw
+        it: committing a claim expires the rest of the batch, which is then
+        reloaded with other workers' leases.
+        """
+        now = int(time())
+        claimed = (
+            EmailOutboxModel.query.filter(
+                EmailOutboxModel.id == self.id,
+                EmailOutboxModel.sent_at.is_(None),
+                EmailOutboxModel.next_attempt_at <= now,
+            )
+            .update({"next_attempt_at": now + lease}, synchronize_session=False)
+        )
+        db.session.commit()
+        return claimed == 1
+
+    def mark_sent(self) -> None:
+        self.attempts += 1
+        self.sent_at = int(time())
+        self.last_error = None
+        self.save_to_db(commit=True)
+
+    def mark_failed(self, error: str, backoff: int) -> None:
+        self.attempts += 1
+        self.last_error = error
+        self.next_attempt_at = int(time()) + backoff * 2 ** (self.attempts - 1)
+        self.save_to_db(commit=True)
+
+    def save_to_db(self, commit: bool = False) -> None:
+        db.session.add(self)
+        save_changes(commit)
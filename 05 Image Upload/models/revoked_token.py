@@ -0,0 +1,25 @@
+from time import time
+
+from db import db, save_changes
+
+
+class RevokedTokenModel(db.Model):
+    __tablename__ = "revoked_tokens"
+
+    jti = db.Column(db.String(120), primary_key=True)
+    # Token `exp` claim; once it has passed the token can't be used anyway
+    expire_at = db.Column(db.Integer, index=True)
+
+    @classmethod
+    def find_by_jti(cls, jti: str) -> "RevokedTokenModel":
+        return cls.query.filter_by(jti=jti).first()
+
+    @classmethod
+    def purge_expired(cls, commit: bool = False) -> int:
+        deleted = cls.query.filter(cls.expire_at < int(time())).delete(synchronize_session=False)
+        save_changes(commit)
+        return deleted
+
+    def save_to_db(self, commit: bool = False) -> None:
+        db.session.merge(self)
+        save_changes(commit)
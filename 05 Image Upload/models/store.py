@@ -1,5 +1,13 @@
-from typing import List
-from db import db
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from typing import Iterable, List, Sequence, Set
+from db import db, save_changes, invalidate_on_commit
+from models.collection_version import CollectionVersionModel
+
+
+@lru_cache(maxsize=None)
+def _store_row(columns: Sequence[str]):
+    return namedtuple("StoreRow", [*columns, "item_list"])
 
 
 class StoreModel(db.Model):
@@ -8,8 +16,13 @@ class StoreModel(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
+    # "stores" collection version of the last change to the store or its items
+    version = db.Column(db.Integer, nullable=False, default=0)
     
     items = db.relationship('ItemModel', lazy="dynamic")
+    # Plain list view of `items` that can be eager loaded, since dynamic
+    # relationships always issue their own query when accessed.
+    item_list = db.relationship('ItemModel', viewonly=True)
 
     @classmethod
     def find_by_name(cls, name: str):
@@ -19,10 +32,47 @@ class StoreModel(db.Model):
     def find_all(cls) -> List:
         return cls.query.all()
 
-    def save_to_db(self) -> None:
+    @classmethod
+    def find_existing_ids(cls, ids: Iterable[int]) -> Set[int]:
+        return {_id for _id, in db.session.query(cls.id).filter(cls.id.in_(list(ids)))}
+
+    @classmethod
+    def find_all_rows(cls, columns: Sequence[str], item_columns: Sequence[str]) -> List:
+        """
+        Load every store and all of their items, read-only, in two queries:
+        selects only `columns` of the stores and `item_columns` of their
+        items, and returns named tuples with an `item_list` of item row
+        tuples instead of model instances.
+        """
+        item = cls.item_list.property.mapper.class_     # ItemModel imports this module
+        item_rows = defaultdict(list)
+        query = db.session.query(
+            item.store_id.label("_store_id"), *[getattr(item, column) for column in item_columns]
+        )
+        for row in query:
+            item_rows[row._store_id].append(row)
+        store_row = _store_row(tuple(columns))
+        stores = db.session.query(cls.id.label("_id"), *[getattr(cls, column) for column in columns])
+        return [store_row(*row[1:], item_rows.get(row._id, [])) for row in stores]
+
+    @staticmethod
+    def cache_key(name: str) -> str:
+        return f"store:{name}"
+
+    @classmethod
+    def touch(cls, *ids: int) -> None:
+        """Give stores a new version, e.g. when their items changed."""
+        version = CollectionVersionModel.bump("stores")
+        cls.query.filter(cls.id.in_(ids)).update({"version": version}, synchronize_session=False)
+
+    def save_to_db(self, commit: bool = False) -> None:
+        invalidate_on_commit(self.cache_key(self.name))
+        self.version = CollectionVersionModel.bump("stores")
         db.session.add(self)
-        db.session.commit()
+        save_changes(commit)
     
-    def delete_from_db(self) -> None:
+    def delete_from_db(self, commit: bool = False) -> None:
+        invalidate_on_commit(self.cache_key(self.name))
+        CollectionVersionModel.bump("stores")
         db.session.delete(self)
-        db.session.commit()
\ No newline at end of file
+        save_changes(commit)
\ No newline at end of file
@@ -1,9 +1,12 @@
-from db import db
+from typing import Union
+
+from db import db, save_changes
 from flask import request, url_for
-from libs.mailgun import Mailgun
-from requests import Response
+from libs.outbox import queue_email
+from libs import passwords
 
 from models.confirmation import ConfirmationModel
+from models.outbox import EmailOutboxModel
 
 
 class UserModel(db.Model):
@@ -13,31 +16,71 @@ class UserModel(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), nullable=False, unique=True)
     email = db.Column(db.String(80), nullable=False, unique=True)
-    password = db.Column(db.String(80), nullable=False)
+    password = db.Column(db.String(255), nullable=False)   # scrypt hash, see libs.passwords
+    avatar = db.Column(db.String(80))     # stored file name inside the avatars folder
+
+    # Denormalized pointer to the newest confirmation, kept up to date by
+    # `new_confirmation` so login doesn't have to look through all of them.
+    current_confirmation_id = db.Column(
+        db.String(50),
+        db.ForeignKey("confirmations.id", use_alter=True, name="fk_users_current_confirmation_id"),
+    )
 
-    confirmation = db.relationship('ConfirmationModel', lazy="dynamic", cascade="all, delete-orphan")
+    confirmation = db.relationship(
+        'ConfirmationModel', lazy="dynamic", cascade="all, delete-orphan",
+        foreign_keys="ConfirmationModel.user_id"
+    )
+    current_confirmation = db.relationship(
+        'ConfirmationModel', foreign_keys=[current_confirmation_id], post_update=True
+    )
 
     # Since nullable is false, we don't need __init__ method
     @property
     def most_recent_confirmation(self) -> "ConfirmationModel":
+        if self.current_confirmation_id is not None:
+            return self.current_confirmation
         return self.confirmation.order_by(db.desc(ConfirmationModel.expire_at)).first()
 
-    def send_confirmation_email(self) -> Response:
+    def new_confirmation(self) -> "ConfirmationModel":
+        """Create a confirmation and make it the user's current one."""
+        confirmation = ConfirmationModel(self.id)
+        self.current_confirmation = confirmation
+        confirmation.save_to_db()
+        return confirmation
+
+    def send_confirmation_email(self) -> EmailOutboxModel:
+        """Queue the confirmation email, it is delivered by the outbox worker."""
         link = request.url_root[0:-1] + url_for(
             "confirmation", confirmation_id=self.most_recent_confirmation.id
         )
         subject = "Registration Confirmation"
         text = f"Please Click the link to confirm your registration. {link}"
         html = f'<html>Please Click the link to confirm your registration. <a href="{link}">Click here!!</a><html>'
-        return Mailgun.send_email([self.email], subject, text, html)
+        return queue_email([self.email], subject, text, html)
+
+    def set_password(self, password: str) -> None:
+        self.password = passwords.run(passwords.hash_password, password)
 
-    def save_to_db(self) -> None:
+    def check_password(self, password: str) -> bool:
+        """
+        Verify the password on the hashing pool. A stored hash made with
+        outdated cost parameters (or a legacy plain text password) is
+        replaced by a fresh hash once the password is known to be correct.
+        """
+        if not passwords.run(passwords.verify_password, password, self.password):
+            return False
+        if passwords.needs_rehash(self.password):
+            self.set_password(password)
+            self.save_to_db()
+        return True
+
+    def save_to_db(self, commit: bool = False) -> None:
         db.session.add(self)
-        db.session.commit()
+        save_changes(commit)
 
-    def delete_from_db(self) -> None:
+    def delete_from_db(self, commit: bool = False) -> None:
         db.session.delete(self)
-        db.session.commit()
+        save_changes(commit)
     
     @classmethod
     def find_by_username(cls, username: str):
@@ -51,3 +94,7 @@ class UserModel(db.Model):
     def find_by_id(cls, _id: int):
         return cls.query.filter_by(id=_id).first()
 
+    @classmethod
+    def find_avatar(cls, _id: int) -> Union[str, None]:
+        return db.session.query(cls.avatar).filter_by(id=_id).scalar()
+
@@ -0,0 +1,15 @@
+from flask_jwt_extended import jwt_required
+from flask_restful import Resource
+
+from libs.cache import cache
+
+
+class CacheStats(Resource):
+    @classmethod
+    @jwt_required
+    def get(cls):
+        """
+        Hit and miss counts of the item/store cache. Counters are per
+        process, so behind several workers each answers with its own.
+        """
+        return cache.stats(), 200
@@ -79,8 +79,7 @@ class ConfirmationByUser(Resource):
                 if confirmation.confirmed:
                     return {"message": gettext("confirmation_already_confirmed")}, 400
                 confirmation.force_to_expire()
-            new_confirmation = ConfirmationModel(user_id)
-            new_confirmation.save_to_db()
+            user.new_confirmation()
             user.send_confirmation_email()
             return {"message": gettext("confirmation_resend_successful")}, 201
         except MailGunException as e:
@@ -1,16 +1,57 @@
-import os
+import re
 import traceback
 from flask_restful import Resource
 from libs.flask_uploads import UploadNotAllowed
-from flask import request, send_file
+from flask import request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-from libs import image_helper
+from libs import image_helper, image_variants
 from libs.strings import gettext
+from models.image import ImageModel
+from models.user import UserModel
 from schemas.image import ImageSchema
 
 image_schema = ImageSchema()
 
+CONTENT_RANGE_REGEX = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+def get_variant_size():
+    """
+    Return the `?size=` asked for (None for the original), or raise
+    ValueError if it isn't one of IMAGE_VARIANT_SIZES.
+    """
+    if "size" not in request.args:
+        return None
+    size = request.args.get("size", type=int)
+    if size not in current_app.config["IMAGE_VARIANT_SIZES"]:
+        raise ValueError(size)
+    return size
+
+
+def send_image(image_path: str, filename: str, size: int = None, digest: str = None):
+    """
+    Send an image, or its `size` variant (as WebP if enabled and the
+    client accepts it), answering conditional and range requests.
+    `filename` gives the type of extensionless files. `digest`, the
+    content hash of a stored image, makes the ETag.
+    """
+    if size is None:
+        return image_helper.send_image_file(image_path, filename, etag=digest)
+    webp = current_app.config["IMAGE_VARIANT_WEBP"] and any(
+        mimetype == "image/webp" and quality for mimetype, quality in request.accept_mimetypes
+    )
+    variant_path = image_variants.get_variant(image_path, size, webp)
+    etag = digest
+    if digest and variant_path != image_path:
+        etag = f"{digest}-{size}{'-webp' if webp else ''}"
+    if variant_path.endswith(image_variants.WEBP_EXTENSION):
+        response = image_helper.send_image_file(variant_path, mimetype="image/webp", etag=etag)
+    else:
+        response = image_helper.send_image_file(variant_path, filename, etag=etag)
+    response.vary.add("Accept")
+    return response
+
 
 class ImageUpload(Resource):
     @classmethod
@@ -20,13 +61,18 @@ class ImageUpload(Resource):
         User to upload an image file.
         It uses JWT to retrieve user information and then saves
         the image to the user's folder.
-        If there is a filename conflict, it appends a number at the end.
+        If there is a filename conflict, it appends a random suffix to the name.
+        With IMAGE_DEDUPLICATION on, the content is stored once however many
+        times it is uploaded, and the name only points at it.
         """
         data = image_schema.load(request.files)     # {"image": FileStorage}
         user_id = get_jwt_identity()
         folder = f"user_{user_id}"  # static/images/user_1
         try:
-            image_path = image_helper.save_image(data["image"], folder=folder)
+            if current_app.config["IMAGE_DEDUPLICATION"]:
+                image_path = image_helper.store_image(data["image"], user_id)
+            else:
+                image_path = image_helper.save_image(data["image"], folder=folder)
             basename = image_helper.get_basename(image_path)
             return {"message": gettext("image_uploaded").format(basename)}, 201
         except UploadNotAllowed:
@@ -34,34 +80,135 @@ class ImageUpload(Resource):
             return {"message": gettext("image_illegal_extension").format(extension)}, 400
 
 
+class ImageStreamUpload(Resource):
+    @classmethod
+    @jwt_required
+    def put(cls, filename: str):
+        """
+        Upload an image as the raw request body, streamed straight to disk.
+        Large images can be sent in pieces with a `Content-Range: bytes
+        start-end/total` header per request; an interrupted upload is
+        resumed from the offset returned by GET. The type is checked
+        against the file's first bytes and the size cap is enforced while
+        reading, so bad uploads are rejected before the body is consumed.
+        A user can have `IMAGE_MAX_OPEN_PARTS` unfinished uploads at a time.
+        """
+        folder = f"user_{get_jwt_identity()}"
+        if not image_helper.is_filename_safe(filename):
+            return {"message": gettext("image_illegal_file_name").format(filename)}, 400
+
+        max_size = current_app.config["IMAGE_MAX_SIZE"]
+        content_range = request.headers.get("Content-Range")
+        if content_range:
+            match = CONTENT_RANGE_REGEX.match(content_range)
+            if not match:
+                return {"message": gettext("image_invalid_range")}, 400
+            start, end, total = (int(value) for value in match.groups())
+            if start > end or end >= total:
+                return {"message": gettext("image_invalid_range")}, 400
+        else:
+            start, end, total = 0, None, request.content_length
+
+        if (total or 0) > max_size:
+            return {"message": gettext("image_too_large").format(max_size)}, 413
+
+        offset = image_helper.get_part_size(filename, folder) if start else 0
+        if start != offset:
+            return {"message": gettext("image_upload_offset_mismatch"), "offset": offset}, 409
+
+        if start == 0 and not image_helper.has_image_part(filename, folder):
+            # a new upload; the user's abandoned ones stop counting once expired
+            max_open = current_app.config["IMAGE_MAX_OPEN_PARTS"]
+            _, open_parts = image_helper.purge_image_parts(
+                current_app.config["IMAGE_PART_MAX_AGE"], folder
+            )
+            if open_parts >= max_open:
+                return {"message": gettext("image_too_many_uploads").format(max_open)}, 429
+
+        try:
+            size, digest = image_helper.write_image_part(
+                request.stream, filename, folder, start, max_size
+            )
+        except image_helper.ImageTooLarge:
+            return {"message": gettext("image_too_large").format(max_size)}, 413
+        except image_helper.ImageContentMismatch:
+            return {"message": gettext("image_content_mismatch").format(filename)}, 400
+
+        if end is not None and size < total:
+            return {"offset": size}, 202
+
+        try:
+            if current_app.config["IMAGE_DEDUPLICATION"]:
+                image_path, digest = image_helper.store_image_part(
+                    filename, folder, get_jwt_identity(), digest
+                )
+            else:
+                image_path, digest = image_helper.finish_image_part(filename, folder, digest)
+        except UploadNotAllowed:
+            extension = image_helper.get_extension(filename)
+            return {"message": gettext("image_illegal_extension").format(extension)}, 400
+        basename = image_helper.get_basename(image_path)
+        return {"message": gettext("image_uploaded").format(basename), "sha256": digest}, 201
+
+    @classmethod
+    @jwt_required
+    def get(cls, filename: str):
+        """Return how many bytes of an interrupted upload were received."""
+        folder = f"user_{get_jwt_identity()}"
+        if not image_helper.is_filename_safe(filename):
+            return {"message": gettext("image_illegal_file_name").format(filename)}, 400
+        return {"offset": image_helper.get_part_size(filename, folder)}, 200
+
+
 class Image(Resource):
     @classmethod
     @jwt_required
     def get(cls, filename: str):
         """
         Returns the requested image if it exists.
-        Looks up inside the logged in user's folder.
+        Looks up the user's stored images, then inside the user's folder.
+        Pass `?size=` for a resized variant instead of the original.
         """
         user_id = get_jwt_identity()
         folder = f"user_{user_id}"
         if not image_helper.is_filename_safe(filename):
             return {"message": gettext("image_illegal_file_name").format(filename)}, 400
         try:
-            return send_file(image_helper.get_path(filename, folder=folder))
+            size = get_variant_size()
+        except ValueError:
+            sizes = current_app.config["IMAGE_VARIANT_SIZES"]
+            return {"message": gettext("image_invalid_size").format(sizes)}, 400
+        image = ImageModel.find_by_name(user_id, filename)
+        try:
+            if image:
+                return send_image(
+                    image_helper.get_blob_path(image.digest), filename, size, image.digest
+                )
+            return send_image(image_helper.get_path(filename, folder=folder), filename, size)
         except FileNotFoundError:
             return {"message": gettext("image_not_found")}, 404
 
     @classmethod
     @jwt_required
     def delete(cls, filename: str):
+        """
+        Deletes a stored image's name, and its content once no other name
+        uses it, or else the file in the user's folder.
+        """
         user_id = get_jwt_identity()
         folder = f"user_{user_id}"
 
         if not image_helper.is_filename_safe(filename):
             return {"message": gettext("image_illegal_file_name").format(filename)}, 400
 
+        image = ImageModel.find_by_name(user_id, filename)
+        if image:
+            if image.delete_from_db(commit=True):
+                image_helper.remove_blob(image.digest)
+            return {"message": gettext("image_deleted").format(filename)}, 200
+
         try:
-            os.remove(image_helper.get_path(filename, folder=folder))
+            image_helper.delete_image(filename, folder)
             return {"message": gettext("image_deleted").format(filename)}, 200
         except FileNotFoundError:
             return {"message": gettext("image_not_found").format(filename)}, 404
@@ -77,38 +224,57 @@ class AvatarUpload(Resource):
         """
         This endpoint is used to upload user avatars. All ovatars are named
         after user's ID. Something like thisL user_{id}.ext
-        Uploading a new avatar overwrites the existing one.
+        Uploading a new avatar replaces the existing one: the new file is
+        saved and recorded on the user first, then the old file is removed.
         """
         data = image_schema.load(request.files)
-        filename = f"user_{get_jwt_identity()}"
+        user = UserModel.find_by_id(get_jwt_identity())
+        if not user:
+            return {"message": gettext("user_not_found")}, 404
+        filename = f"user_{user.id}"
         folder = "avatars"
-        avatar_path = image_helper.find_image_any_format(filename, folder)
-        if avatar_path:
-            try:
-                os.remove(avatar_path)
-            except:
-                return {"message": gettext("avatar_delete_failed")}, 500
         try:
             ext = image_helper.get_extension(data['image'].filename)
             avatar = filename + ext
             avatar_path = image_helper.save_image(
                 data['image'], folder=folder, name=avatar
             )
-            basename = image_helper.get_basename(avatar_path)
-            return {"message": gettext("avatar_uploaded").format(basename)}, 200
         except UploadNotAllowed:
             extension = image_helper.get_extension(data['image'])
             return {"message": gettext("image_illegal_extension").format(extension)}, 400
 
+        basename = image_helper.get_basename(avatar_path)
+        old_avatar = user.avatar
+        user.avatar = basename
+        user.save_to_db(commit=True)
+        if old_avatar and old_avatar != basename:
+            # the new avatar is already committed, a leftover old file
+            # doesn't fail the upload
+            try:
+                image_helper.delete_image(old_avatar, folder)
+            except FileNotFoundError:
+                pass
+            except:
+                traceback.print_exc()
+        return {"message": gettext("avatar_uploaded").format(basename)}, 200
+
 
 class Avatar(Resource):
 
     @classmethod
     @jwt_required
     def get(cls, user_id: int):
+        """Returns the user's avatar, resized if `?size=` is given."""
         folder = 'avatars'
-        filename = f"user_{user_id}"
-        avatar = image_helper.find_image_any_format(filename, folder)
+        try:
+            size = get_variant_size()
+        except ValueError:
+            sizes = current_app.config["IMAGE_VARIANT_SIZES"]
+            return {"message": gettext("image_invalid_size").format(sizes)}, 400
+        avatar = UserModel.find_avatar(user_id)
         if avatar:
-            return send_file(avatar)
+            try:
+                return send_image(image_helper.get_path(avatar, folder=folder), avatar, size)
+            except FileNotFoundError:
+                pass
         return {"message": gettext("avatar_not_found")}, 404
@@ -1,5 +1,8 @@
+import json
+from itertools import islice
+
 from flask_restful import Resource
-from flask import request
+from flask import request, current_app, Response, stream_with_context
 from marshmallow import ValidationError
 from flask_jwt_extended import (
     jwt_required, 
@@ -7,21 +10,36 @@ from flask_jwt_extended import (
 )
 from schemas.item import ItemSchema
 from models.item import ItemModel
+from models.store import StoreModel
+from models.collection_version import CollectionVersionModel
 from libs.strings import gettext
+from libs.cache import cache
+from libs.etags import etag_header, not_modified
+from libs.fast_json import dumps
+from libs.schema_compiler import dumped_columns
 
 
 item_schema = ItemSchema()
 item_list_schema = ItemSchema(many=True)
+# Read endpoints only select what the schema dumps
+ITEM_COLUMNS = dumped_columns(item_list_schema, ItemModel)
 
 
 class Item(Resource):
 
     @classmethod
     def get(cls, name: str):
-        item = ItemModel.find_by_name(name)
-        if item:
-            return item_schema.dump(item), 200
-        return {'message': gettext("item_not_found")}, 404
+        cached = cache.get_or_set(ItemModel.cache_key(name), lambda: cls._load(name))
+        if not cached:
+            return {'message': gettext("item_not_found")}, 404
+        version = cached["version"]
+        return not_modified(version) or (cached["item"], 200, etag_header(version))
+
+    @classmethod
+    def _load(cls, name: str):
+        """The dumped item with its version, as cached."""
+        item = ItemModel.find_row_by_name(name, [*ITEM_COLUMNS, "version"])
+        return {"version": item.version, "item": item_schema.dump(item)} if item else None
 
     @classmethod
     @jwt_required
@@ -70,7 +88,109 @@ class Item(Resource):
 class ItemList(Resource):
     @classmethod
     def get(cls):
-        return {'items': item_list_schema.dump(ItemModel.find_all())}, 200
+        """
+        Return a page of items ordered by id. Use `limit` to set the page
+        size and pass the returned `next_after` back as `after` to fetch
+        the following page. With `format=ndjson` every item is streamed
+        as one JSON document per line instead.
+        Both are tagged with the version of the items collection.
+        """
+        version = CollectionVersionModel.find_version("items")
+        if request.args.get("format") == "ndjson":
+            return not_modified(version) or cls._stream(version)
+
+        max_limit = current_app.config["ITEMS_MAX_PAGE_SIZE"]
+        try:
+            limit = int(request.args.get("limit", current_app.config["ITEMS_PAGE_SIZE"]))
+            after = request.args.get("after")
+            after = int(after) if after is not None else None
+        except ValueError:
+            return {"message": gettext("item_invalid_pagination").format(max_limit)}, 400
+        if not 1 <= limit <= max_limit:
+            return {"message": gettext("item_invalid_pagination").format(max_limit)}, 400
+
+        response = not_modified(version)
+        if response:
+            return response
+        items = ItemModel.find_page_rows(ITEM_COLUMNS, limit, after)
+        next_after = items[-1].id if len(items) == limit else None
+        return (
+            {'items': item_list_schema.dump(items), 'next_after': next_after},
+            200,
+            etag_header(version),
+        )
+
+    @classmethod
+    def _stream(cls, version: int) -> Response:
+        batch_size = current_app.config["ITEMS_STREAM_BATCH_SIZE"]
+
+        def generate():
+            rows = iter(ItemModel.iter_rows(ITEM_COLUMNS, batch_size))
+            for batch in iter(lambda: list(islice(rows, batch_size)), []):
+                yield b"".join(dumps(item) + b"\n" for item in item_list_schema.dump(batch))
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson",
+            headers=etag_header(version),
+        )
+
+
+class ItemBulk(Resource):
+    @classmethod
+    @jwt_required
+    def post(cls):
+        """
+        Insert or update many items at once. Takes a JSON array of items, or
+        one item per line with Content-Type `application/x-ndjson`.
+        Invalid rows are reported by index and skipped, the rest are saved
+        in a single transaction. Rows identical to the stored item don't
+        count as updated.
+        """
+        errors = {}
+        if request.mimetype == "application/x-ndjson":
+            rows = []
+            for index, line in enumerate(request.stream):
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    rows.append(None)
+                    errors[index] = {"_schema": [gettext("item_bulk_invalid_json")]}
+        else:
+            rows = request.get_json()
+            if not isinstance(rows, list):
+                return {"message": gettext("item_bulk_invalid")}, 400
+
+        try:
+            loaded = item_list_schema.load(rows)
+        except ValidationError as err:
+            loaded = err.valid_data
+            errors = {**err.messages, **errors}
+
+        items = {}
+        for index, item in enumerate(loaded):
+            if index in errors:
+                continue
+            if item["name"] in items:
+                errors[index] = {"name": [gettext("item_bulk_duplicate_name").format(item["name"])]}
+                continue
+            items[item["name"]] = (index, item)
+
+        known_stores = StoreModel.find_existing_ids(item["store_id"] for _, item in items.values())
+        valid_items = []
+        for index, item in items.values():
+            if item["store_id"] not in known_stores:
+                errors[index] = {"store_id": [gettext("item_bulk_store_not_found").format(item["store_id"])]}
+            else:
+                valid_items.append(item)
+
+        try:
+            inserted, updated = ItemModel.bulk_upsert(
+                valid_items, current_app.config["ITEMS_BULK_CHUNK_SIZE"]
+            )
+        except:
+            return {"message": gettext("item_error_inserting")}, 500
+
+        return {"inserted": inserted, "updated": updated, "errors": errors}, 200
 
 
 # class ItemList(Resource):
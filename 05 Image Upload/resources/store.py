@@ -1,20 +1,35 @@
 from flask_jwt_extended import jwt_required
 from flask_restful import Resource
+from models.item import ItemModel
 from models.store import StoreModel
+from models.collection_version import CollectionVersionModel
 from schemas.store import StoreSchema
 from libs.strings import gettext
+from libs.cache import cache
+from libs.etags import etag_header, not_modified
+from libs.schema_compiler import dumped_columns
 
 store_schema = StoreSchema()
 store_list_schema = StoreSchema(many=True)
+# Read endpoints only select what the schemas dump
+STORE_COLUMNS = dumped_columns(store_list_schema, StoreModel)
+STORE_ITEM_COLUMNS = dumped_columns(store_list_schema.fields["items"].schema, ItemModel)
 
 
 class Store(Resource):
     @classmethod
     def get(cls, name: str):
+        cached = cache.get_or_set(StoreModel.cache_key(name), lambda: cls._load(name))
+        if not cached:
+            return {"message": gettext("store_not_found")}, 404
+        version = cached["version"]
+        return not_modified(version) or (cached["store"], 200, etag_header(version))
+
+    @classmethod
+    def _load(cls, name: str):
+        """The dumped store with its version, as cached."""
         store = StoreModel.find_by_name(name)
-        if store:
-            return store_schema.dump(store), 200
-        return {"message": gettext("store_not_found")}, 404
+        return {"version": store.version, "store": store_schema.dump(store)} if store else None
 
     @classmethod
     @jwt_required
@@ -40,4 +55,9 @@ class Store(Resource):
 class StoreList(Resource):
     @classmethod
     def get(cls):
-        return {'stores': store_list_schema.dump(StoreModel.find_all())}, 200
+        version = CollectionVersionModel.find_version("stores")
+        response = not_modified(version)
+        if response:
+            return response
+        stores = StoreModel.find_all_rows(STORE_COLUMNS, STORE_ITEM_COLUMNS)
+        return {'stores': store_list_schema.dump(stores)}, 200, etag_header(version)
@@ -1,7 +1,7 @@
 import traceback
+from concurrent.futures import TimeoutError
 from flask_restful import Resource
 from flask import request
-from werkzeug.security import safe_str_cmp
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
@@ -10,11 +10,11 @@ from flask_jwt_extended import (
     jwt_required,
     get_raw_jwt,
 )
+from libs import passwords
 from libs.mailgun import MailGunException
 from models.user import UserModel
 from schemas.user import UserSchema
 from blacklist import BLACKLIST
-from models.confirmation import ConfirmationModel
 from libs.strings import gettext
 
 
@@ -34,18 +34,20 @@ class UserRegister(Resource):
             return {"message": gettext("user_email_exists")}, 400
 
         user = UserModel(**user_dict)
+        try:
+            user.set_password(user_dict['password'])
+        except TimeoutError:
+            return {"message": gettext("user_password_busy")}, 503
+
         try:
             user.save_to_db()
-            confirmation = ConfirmationModel(user.id)
-            confirmation.save_to_db()
+            user.new_confirmation()
             user.send_confirmation_email()
             return {"message": gettext("user_registered")}, 201
         except MailGunException as e:
-            user.delete_from_db()
             return {"message": str(e)}, 500
         except:
             traceback.print_exc()
-            user.delete_from_db()
             return {"message": gettext("user_error_creating")}, 500
 
 
@@ -76,7 +78,15 @@ class UserLogin(Resource):
 
         user = UserModel.find_by_username(user_dict['username'])
 
-        if user and safe_str_cmp(user_dict['password'], user.password):
+        try:
+            if user:
+                valid_password = user.check_password(user_dict['password'])
+            else:
+                valid_password = passwords.verify_dummy(user_dict['password'])
+        except TimeoutError:
+            return {"message": gettext("user_password_busy")}, 503
+
+        if valid_password:
             confirmation = user.most_recent_confirmation
             if confirmation and confirmation.confirmed:
                 access_token = create_access_token(identity=user.id, fresh=True)
@@ -91,9 +101,10 @@ class UserLogout(Resource):
     @classmethod
     @jwt_required
     def post(cls):
-        jti = get_raw_jwt()["jti"]  # jti is "JWT ID", a unique identifier for a JWT.
+        raw_jwt = get_raw_jwt()
+        jti = raw_jwt["jti"]  # jti is "JWT ID", a unique identifier for a JWT.
         user_username = get_jwt_identity()
-        BLACKLIST.add(jti)
+        BLACKLIST.add(jti, raw_jwt.get("exp"))
         return {"message": gettext("user_logged_out").format(user_username)}, 200
 
 
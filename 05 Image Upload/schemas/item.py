@@ -1,11 +1,13 @@
 from ma import ma
+from libs.schema_compiler import CompiledDumpMixin
 from models.item import ItemModel
 from models.store import StoreModel
 
 
-class ItemSchema(ma.SQLAlchemyAutoSchema):
+class ItemSchema(CompiledDumpMixin, ma.SQLAlchemyAutoSchema):
     class Meta:
         model = ItemModel
         load_only = ('store',)
         dump_only = ("id", )
         include_fk = True
+        exclude = ("version",)
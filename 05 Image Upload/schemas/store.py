@@ -1,13 +1,15 @@
 from ma import ma
+from libs.schema_compiler import CompiledDumpMixin
 from models.store import StoreModel
 from models.item import ItemModel
 from schemas.item import ItemSchema
 
 
-class StoreSchema(ma.SQLAlchemyAutoSchema):
-    items = ma.Nested(ItemSchema, many=True)
+class StoreSchema(CompiledDumpMixin, ma.SQLAlchemyAutoSchema):
+    items = ma.Nested(ItemSchema, many=True, attribute="item_list")
 
     class Meta:
         model = StoreModel
         dump_only = ('id',)
         include_fk = True
+        exclude = ("version",)
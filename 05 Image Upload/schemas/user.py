@@ -1,15 +1,19 @@
 from ma import ma
-from marshmallow import pre_dump
+from marshmallow import fields
 from models.user import UserModel
+from schemas.confirmation import ConfirmationSchema
+
+confirmation_schema = ConfirmationSchema()
 
 
 class UserSchema(ma.SQLAlchemyAutoSchema):
+    confirmation = fields.Method("_dump_confirmation")
+
     class Meta:
         model = UserModel
         load_only = ('password',)
-        dump_only = ('id', 'confirmation')
+        dump_only = ('id', 'confirmation', 'avatar')
 
-    @pre_dump
-    def _pre_dump(self, user: UserModel):
-        user.confirmation = [user.most_recent_confirmation]
-        return user
+    def _dump_confirmation(self, user: UserModel):
+        confirmation = user.most_recent_confirmation
+        return [confirmation_schema.dump(confirmation)] if confirmation else []
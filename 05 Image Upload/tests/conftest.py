@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+import pytest
+
+# app.py reads its settings at import time
+_db_fd, _db_path = tempfile.mkstemp(suffix=".db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+os.environ.setdefault("JWT_SECRET_KEY", "test")
+os.environ.setdefault(
+    "APPLICATION_SETTINGS", os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.py")
+)
+
+from app import app as flask_app  # noqa: E402
+from db import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.close(_db_fd)
+    os.remove(_db_path)
@@ -0,0 +1,14 @@
+from libs.cache import Cache, LRUCache
+
+
+def test_value_loaded_across_an_invalidation_is_not_stored():
+    cache = Cache(LRUCache())
+
+    def load_then_commit():
+        # a writer commits, and invalidates, while the old value is loaded
+        cache.invalidate("item:chair")
+        return "old"
+
+    assert cache.get_or_set("item:chair", load_then_commit) == "old"
+    assert cache.get_or_set("item:chair", lambda: "new") == "new"
+    assert cache.get_or_set("item:chair", lambda: "newer") == "new"
@@ -0,0 +1,29 @@
+from sqlalchemy.exc import IntegrityError
+
+from db import db, invalidate_on_commit
+from libs.cache import cache
+from models.store import StoreModel
+
+
+def test_savepoint_rollback_keeps_pending_invalidations(app):
+    StoreModel(name="taken").save_to_db(commit=True)
+    cache.backend.set("some:key", "stale")
+
+    invalidate_on_commit("some:key")
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoreModel(name="taken"))
+    except IntegrityError:
+        pass
+    db.session.commit()
+
+    assert cache.backend.get("some:key") is None
+
+
+def test_rollback_discards_pending_invalidations(app):
+    cache.backend.set("other:key", "kept")
+    invalidate_on_commit("other:key")
+    db.session.rollback()
+    db.session.commit()
+
+    assert cache.backend.get("other:key") == "kept"
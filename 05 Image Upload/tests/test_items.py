@@ -0,0 +1,47 @@
+from db import db
+from models.collection_version import CollectionVersionModel
+from models.item import ItemModel
+from models.store import StoreModel
+
+
+def versions():
+    return (
+        CollectionVersionModel.find_version("items"),
+        CollectionVersionModel.find_version("stores"),
+        {name: version for name, version in db.session.query(StoreModel.name, StoreModel.version)},
+    )
+
+
+def test_bulk_upsert_only_bumps_versions_for_written_rows(app):
+    first, second = StoreModel(name="first"), StoreModel(name="second")
+    first.save_to_db()
+    second.save_to_db()
+    ItemModel.bulk_upsert([{"name": "chair", "price": 10.0, "store_id": first.id}], 100, commit=True)
+    before = versions()
+
+    assert ItemModel.bulk_upsert([], 100, commit=True) == (0, 0)
+    assert ItemModel.bulk_upsert(
+        [{"name": "chair", "price": 10.0, "store_id": first.id}], 100, commit=True
+    ) == (0, 0)
+    assert versions() == before
+
+    assert ItemModel.bulk_upsert(
+        [{"name": "chair", "price": 12.0, "store_id": first.id}], 100, commit=True
+    ) == (0, 1)
+    items, stores, store_versions = versions()
+    assert items > before[0] and stores > before[1]
+    assert store_versions["first"] > before[2]["first"]
+    assert store_versions["second"] == before[2]["second"]
+
+
+def test_items_etag_follows_writes_from_other_processes(client):
+    store = StoreModel(name="first")
+    store.save_to_db()
+    ItemModel(name="chair", price=10.0, store_id=store.id).save_to_db(commit=True)
+    etag = client.get("/items").headers["ETag"]
+    assert client.get("/items", headers={"If-None-Match": etag}).status_code == 304
+
+    # another worker's write invalidates nothing in this process
+    db.session.execute("UPDATE collection_versions SET version = version + 1 WHERE name = 'items'")
+    db.session.commit()
+    assert client.get("/items", headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,47 @@
+from db import db
+from libs import outbox
+from libs.outbox import OutboxWorker
+from models.outbox import EmailOutboxModel
+
+
+def queue(count: int, subject: str = "subject") -> None:
+    for i in range(count):
+        EmailOutboxModel([f"user{i}@example.com"], subject, f"text {i}", f"html {i}").save_to_db()
+    db.session.commit()
+
+
+def test_two_workers_send_each_email_once(app, monkeypatch):
+    queue(3)
+    first, second = OutboxWorker(app), OutboxWorker(app)
+    sent = []
+    claim = EmailOutboxModel.claim
+
+    def claim_then_run_second(message, lease):
+        claimed = claim(message, lease)
+        if message.email == ["user0@example.com"]:
+            # the other worker runs while the first is still in its batch
+            second.process_batch()
+        return claimed
+
+    monkeypatch.setattr(EmailOutboxModel, "claim", claim_then_run_second)
+    monkeypatch.setattr(outbox.Mailgun, "send_email", lambda email, *args: sent.extend(email))
+    monkeypatch.setattr(outbox.Mailgun, "send_batch", lambda variables, *args: sent.extend(variables))
+    first.process_batch()
+
+    assert sorted(sent) == [f"user{i}@example.com" for i in range(3)]
+    assert EmailOutboxModel.query.filter(EmailOutboxModel.sent_at.is_(None)).count() == 0
+
+
+def test_same_subject_emails_go_out_in_one_batch(app, monkeypatch):
+    queue(3)
+    queue(1, subject="other")
+    calls = []
+    monkeypatch.setattr(outbox.Mailgun, "send_email", lambda *args: calls.append(("email", args)))
+    monkeypatch.setattr(outbox.Mailgun, "send_batch", lambda *args: calls.append(("batch", args)))
+    OutboxWorker(app).process_batch()
+
+    batches = [args for kind, args in calls if kind == "batch"]
+    assert len(calls) == 2 and len(batches) == 1
+    variables, subject, text, html = batches[0]
+    assert subject == "subject" and text == "%recipient.text%" and html == "%recipient.html%"
+    assert variables["user1@example.com"] == {"text": "text 1", "html": "html 1"}
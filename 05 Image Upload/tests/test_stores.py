@@ -0,0 +1,53 @@
+"""Run from the chapter folder with `python -m pytest tests`."""
+
+from sqlalchemy import event
+
+from db import db
+from models.item import ItemModel
+from models.store import StoreModel
+
+ITEMS_PER_STORE = 3
+
+
+def add_stores(count: int) -> None:
+    start = StoreModel.query.count()
+    for s in range(start, start + count):
+        store = StoreModel(name=f"store {s}")
+        store.save_to_db()
+        for i in range(ITEMS_PER_STORE):
+            ItemModel(name=f"item {s}-{i}", price=i, store_id=store.id).save_to_db()
+    db.session.commit()
+
+
+def count_queries(client, url: str) -> int:
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+def test_store_list_query_count_does_not_grow_with_stores(client):
+    client.get("/stores")   # runs the app's first-request hooks
+    counts = []
+    for added in (1, 9, 40):
+        add_stores(added)
+        counts.append(count_queries(client, "/stores"))
+    assert len(client.get("/stores").get_json()["stores"]) == 50
+    assert counts == [counts[0]] * len(counts)
+
+
+def test_not_modified_varies_on_accept_encoding(client):
+    add_stores(1)
+    etag = client.get("/stores").headers["ETag"]
+    response = client.get("/stores", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert "Content-Encoding" not in response.headers